@@ -1,4 +1,3 @@
-import pygame
 import sys
 import math
 import random
@@ -6,16 +5,36 @@ from datetime import datetime, timedelta
 import os
 import time
 import copy
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import queue
+from collections import deque, OrderedDict
+import hashlib
+import struct
+import tempfile
+import io
+import argparse
+import contextlib
+import glob
+import json
+import re
+import mmap
 
-# Initialize pygame
-pygame.init()
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Only the batch engines need it
 
 # Constants
 TITLE = "BoxBang"
 TILE_SIZE = 50
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
-FPS = 60
+FPS = 60  # Frame cap during auto-solve playback, 0 for none
+IDLE_POLL_MS = 250  # How often an idle window wakes up while a solver runs in the background
+HINT_TIME = 1.0  # Seconds a hint may search when the position is far from every plan
 
 # Colors
 WHITE = (255, 255, 255)
@@ -38,24 +57,239 @@ CRATE_ON_TARGET = '*'
 PLAYER_ON_TARGET = '+'
 FLOOR = ' '
 
-# Create the screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption(TITLE)
-clock = pygame.time.Clock()
+DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0)]  # up, right, down, left
 
-# Font
-font = pygame.font.SysFont('Arial', 24)
-small_font = pygame.font.SysFont('Arial', 16)
-large_font = pygame.font.SysFont('Arial', 36)
+SOLUTION_CACHE_DIR = ".boxbang_cache"
+PATTERN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deadlock_patterns.bin")
+
+# Display objects, created by init_display() so the rules and solvers can be
+# imported (by tests, servers or the batch CLI) without opening a window
+pygame = None
+screen = None
+clock = None
+font = None
+small_font = None
+large_font = None
+
+DEFAULT_LEVEL = """\
+#######
+#     #
+# $ . #
+#  @  #
+#######
+"""
+
+def init_display():
+    """Import pygame and create the window, clock and fonts"""
+    global pygame, screen, clock, font, small_font, large_font
+    if screen is not None:
+        return
+    import pygame as pygame_module
+    pygame = pygame_module
+    pygame.init()
+    
+    # Create the screen
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption(TITLE)
+    clock = pygame.time.Clock()
+    
+    # Font
+    font = pygame.font.SysFont('Arial', 24)
+    small_font = pygame.font.SysFont('Arial', 16)
+    large_font = pygame.font.SysFont('Arial', 36)
+
+def parse_level(text):
+    """Parse level text into (grid, player_pos, crates_pos, targets_pos)"""
+    grid = []
+    player_pos = [0, 0]
+    crates_pos = []
+    targets_pos = []
+    
+    rows = text.strip('\r\n').splitlines()
+    width = max((len(row) for row in rows), default=0)
+    for y, row in enumerate(rows):
+        grid_row = []
+        for x, cell in enumerate(row.ljust(width)):
+            if cell == PLAYER:
+                player_pos = [x, y]
+                grid_row.append(FLOOR)
+            elif cell == CRATE:
+                crates_pos.append([x, y])
+                grid_row.append(FLOOR)
+            elif cell == TARGET:
+                targets_pos.append([x, y])
+                grid_row.append(FLOOR)
+            elif cell == CRATE_ON_TARGET:
+                crates_pos.append([x, y])
+                targets_pos.append([x, y])
+                grid_row.append(FLOOR)
+            elif cell == PLAYER_ON_TARGET:
+                player_pos = [x, y]
+                targets_pos.append([x, y])
+                grid_row.append(FLOOR)
+            elif cell in '-_':  # Alternative floor characters used in .xsb/.sok packs
+                grid_row.append(FLOOR)
+            else:
+                grid_row.append(cell)
+        grid.append(grid_row)
+    
+    return grid, player_pos, crates_pos, targets_pos
+
+def load_level_file(filename):
+    """Read a level file, or one level of a pack given as "pack.sok#N", into a GameState"""
+    return open_level(filename).to_game_state()
+
+def open_level(spec):
+    """Return the Level for a lvlN.txt file or a "pack.xsb#N" reference (N counts from 1)"""
+    path, _, number = spec.partition('#')
+    if number:
+        level = LevelPack.shared(path).get(int(number))
+        if level is None:
+            raise ValueError(f"{path} has no level {number}")
+        return level
+    with open(path, "r") as f:
+        return Level.parse(f.read(), os.path.basename(path))
+
+class Level:
+    """A parsed level, kept around so restarting it never touches the disk again"""
+    def __init__(self, grid, player_pos, crates_pos, targets_pos, title=""):
+        self.grid = grid
+        self.player_pos = player_pos
+        self.crates_pos = crates_pos
+        self.targets_pos = targets_pos
+        self.title = title
+        self._board = None
+    
+    @classmethod
+    def parse(cls, text, title=""):
+        return cls(*parse_level(text), title)
+    
+    @property
+    def board(self):
+        if self._board is None:
+            self._board = LevelBoard.for_level(self.grid, self.targets_pos, len(self.crates_pos))
+        return self._board
+    
+    def to_game_state(self):
+        """Fresh GameState at the start of the level"""
+        return GameState([row[:] for row in self.grid], self.player_pos, self.crates_pos, self.targets_pos,
+                         board=self.board)
+
+class LevelFiles:
+    """The lvlN.txt files of a directory, parsed on first use"""
+    def __init__(self, directory="."):
+        self.paths = {}
+        for path in find_level_files(directory):
+            self.paths[int(re.search(r"(\d+)\.txt$", path).group(1))] = path
+        self.numbers = sorted(self.paths)
+        self._levels = {}
+    
+    def __len__(self):
+        return len(self.numbers)
+    
+    def get(self, number):
+        """Return level number as a Level, or None if there is no such file"""
+        level = self._levels.get(number)
+        if level is None and number in self.paths:
+            level = self._levels[number] = open_level(self.paths[number])
+        return level
+
+class LevelPack:
+    """A standard .xsb/.sok collection holding any number of levels in one file.
+    
+    Opening a pack only finds the byte range of every level, with one regex
+    pass over a memory map; each level is parsed the first time it is used
+    and kept as a Level from then on.
+    """
+    # A board is a run of lines made of board characters with at least one wall each
+    BOARD = re.compile(rb"(?:^[ \t#@$.*+_-]*#[ \t#@$.*+_-]*(?:\r?\n|\Z))+", re.M)
+    
+    def __init__(self, data, name="pack"):
+        self.data = data  # bytes or an mmap of the file
+        self.name = name
+        self.spans = [match.span() for match in self.BOARD.finditer(data)]
+        self.numbers = range(1, len(self.spans) + 1)
+        self._levels = {}
+        self._file = None
+    
+    _shared = {}
+    
+    @classmethod
+    def shared(cls, path):
+        """Open pack kept for the life of the process, for callers that look up levels one by one"""
+        pack = cls._shared.get(path)
+        if pack is None:
+            pack = cls._shared[path] = cls.open(path)
+        return pack
+    
+    @classmethod
+    def open(cls, path):
+        f = open(path, "rb")
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            data = b""  # Empty files cannot be mapped
+        pack = cls(data, os.path.basename(path))
+        pack._file = f
+        return pack
+    
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._file is not None:
+            self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __len__(self):
+        return len(self.spans)
+    
+    def get(self, number):
+        """Return level number (counting from 1) as a Level, or None if the pack is shorter"""
+        if not 1 <= number <= len(self.spans):
+            return None
+        level = self._levels.get(number)
+        if level is None:
+            start, end = self.spans[number - 1]
+            text = self.data[start:end].decode("latin-1")
+            level = self._levels[number] = Level.parse(text, self.title(number))
+        return level
+    
+    def title(self, number):
+        """The "Title:" line after a level, else the last text line before it, else the pack name and number"""
+        start, end = self.spans[number - 1]
+        following = self.spans[number][0] if number < len(self.spans) else len(self.data)
+        for line in self.data[end:following].decode("latin-1").splitlines():
+            if line.lower().startswith("title:"):
+                return line[6:].strip()
+        previous = self.spans[number - 2][1] if number > 1 else 0
+        for line in reversed(self.data[previous:start].decode("latin-1").splitlines()):
+            line = line.strip().lstrip(";").strip()
+            if line and ":" not in line:
+                return line
+        return f"{self.name} #{number}"
+
+def open_levels(source="."):
+    """Level collection for a directory of lvlN.txt files or a .xsb/.sok pack"""
+    if os.path.isdir(source):
+        return LevelFiles(source)
+    return LevelPack.open(source)
 
 class GameState:
-    def __init__(self, level_grid, player_pos, crates_pos, targets_pos, move_count=0):
+    def __init__(self, level_grid, player_pos, crates_pos, targets_pos, move_count=0, board=None):
         self.grid = level_grid
         self.player_pos = player_pos[:]
         self.crates_pos = [crate[:] for crate in crates_pos]
         self.targets_pos = targets_pos[:]
         self.move_count = move_count
         self.moves_history = []
+        if board is None:
+            board = LevelBoard.for_level(level_grid, targets_pos, len(crates_pos))
+        self.board = board  # Static per-level tables (dead squares etc.)
     
     def copy(self):
         return GameState(
@@ -63,7 +297,8 @@ class GameState:
             self.player_pos[:],
             [crate[:] for crate in self.crates_pos],
             self.targets_pos[:],
-            self.move_count
+            self.move_count,
+            self.board
         )
     
     def evaluate(self):
@@ -72,15 +307,11 @@ class GameState:
             # Solved state - return negative move count to prefer fewer moves
             return -self.move_count
         
-        total_distance = 0
-        
-        # Calculate minimum total distance from crates to targets
+        # Minimum-cost matching of crates to targets over real push distances
+        crates = 0
         for crate in self.crates_pos:
-            min_dist = float('inf')
-            for target in self.targets_pos:
-                dist = abs(crate[0] - target[0]) + abs(crate[1] - target[1])
-                min_dist = min(min_dist, dist)
-            total_distance += min_dist
+            crates |= 1 << self.board.index(*crate)
+        total_distance = AssignmentBound(self.board, crates).cost
         
         # Add penalty for deadlocks
         deadlock_penalty = 0
@@ -101,39 +332,23 @@ class GameState:
         return total_distance + deadlock_penalty + blocking_penalty + move_penalty
 
     def _is_deadlock(self, crate):
-        """Check if a crate is in a deadlock position"""
-        x, y = crate
-        
-        # If on target, not deadlocked
-        if [x, y] in self.targets_pos:
-            return False
-        
-        # Check for corner deadlock
-        left_blocked = x == 0 or self.grid[y][x-1] == WALL
-        right_blocked = x == len(self.grid[0])-1 or self.grid[y][x+1] == WALL
-        top_blocked = y == 0 or self.grid[y-1][x] == WALL
-        bottom_blocked = y == len(self.grid)-1 or self.grid[y+1][x] == WALL
-        
-        # Corner deadlock
-        if (left_blocked or right_blocked) and (top_blocked or bottom_blocked):
-            return True
-        
-        return False
+        """Check if a crate sits on a square from which no target can be reached"""
+        # Targets are never dead, and corners are always dead
+        return bool(self.board.dead_squares[self.board.index(*crate)])
     
     def is_solved(self):
-        """Check if all crates are on targets"""
+        """Check if all crates are on targets (or all targets covered when there are spare crates)"""
         crates_on_targets = 0
         for crate in self.crates_pos:
             if crate in self.targets_pos:
                 crates_on_targets += 1
-        return crates_on_targets == len(self.targets_pos)
+        return crates_on_targets == min(len(self.crates_pos), len(self.targets_pos))
     
     def get_possible_moves(self):
         """Get all possible moves from current state"""
         moves = []
-        directions = [(0, -1), (1, 0), (0, 1), (-1, 0)]  # up, right, down, left
         
-        for dx, dy in directions:
+        for dx, dy in DIRECTIONS:
             new_x, new_y = self.player_pos[0] + dx, self.player_pos[1] + dy
             
             # Check bounds
@@ -172,7 +387,16 @@ class GameState:
                         crate_blocked = True
                         break
                 
-                if not crate_blocked:
+                if crate_blocked:
+                    continue
+                
+                # Skip pushes that leave the level provably unsolvable
+                crates = 0
+                for crate in self.crates_pos:
+                    if crate is not crate_at_pos:
+                        crates |= 1 << self.board.index(*crate)
+                new_crate = self.board.index(new_crate_x, new_crate_y)
+                if not self.board.push_is_deadlock(crates | (1 << new_crate), new_crate):
                     moves.append((dx, dy))
             else:
                 moves.append((dx, dy))
@@ -199,193 +423,2775 @@ class GameState:
         
         return new_state
 
-class SimulatedAnnealingSolver:
-    def __init__(self, initial_state, max_iterations=5000, initial_temp=1000, cooling_rate=0.995, max_moves=50):
-        self.initial_state = initial_state
+def iter_cells(bits):
+    """Yield the index of every set bit in a crate bitset"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class ZobristTable:
+    """Random 64-bit keys used to hash player and crate cells"""
+    def __init__(self, cell_count, seed=0x5EED):
+        rng = random.Random(seed)
+        self.player_keys = [rng.getrandbits(64) for _ in range(cell_count)]
+        self.crate_keys = [rng.getrandbits(64) for _ in range(cell_count)]
+    
+    def hash_cells(self, player, crates):
+        """Hash a full state from scratch"""
+        h = self.player_keys[player]
+        for cell in iter_cells(crates):
+            h ^= self.crate_keys[cell]
+        return h
+
+class TranspositionTable:
+    """Visited-state store with a fixed byte budget, for searches too big to remember every state.
+    
+    Maps 64-bit Zobrist keys to (cost, parent key, move) like the dicts the
+    searches use otherwise; cost is a pair of small ints. Entries live in
+    32-byte slots of a preallocated buffer, in buckets of BUCKET slots.
+    A full bucket gives up its least valuable entry, the deepest one
+    (policy='depth') or the least looked-up one (policy='visits'). With
+    spill_dir that entry moves to a larger memory-mapped hash file
+    created there, which lookups fall through to, instead of being lost.
+    """
+    SLOT = struct.Struct('<QQIIHBBH2x')  # key, parent, cost, tie-break, visits, move, flags, generation
+    BUCKET = 4
+    OCCUPIED = 1
+    HAS_PARENT = 2
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, spill_dir=None, spill_bytes=1024 ** 3, policy='depth'):
+        if policy not in ('depth', 'visits'):
+            raise ValueError(f"policy must be 'depth' or 'visits', not {policy!r}")
+        self.policy = policy
+        self.levels = [bytearray(self._bucket_bytes(max_bytes))]
+        self.spill_path = None
+        self._spill_file = None
+        if spill_dir is not None:
+            size = self._bucket_bytes(spill_bytes)
+            fd, self.spill_path = tempfile.mkstemp(prefix="boxbang-", suffix=".spill", dir=spill_dir)
+            self._spill_file = os.fdopen(fd, "w+b")
+            self._spill_file.truncate(size)  # Sparse: disk blocks are only used once written
+            self.levels.append(mmap.mmap(self._spill_file.fileno(), size))
+        self.generation = 0
+        self.count = 0  # Slots in use in the current generation
+        self.hits = self.misses = self.spilled = self.evicted = 0
+    
+    @classmethod
+    def _bucket_bytes(cls, size):
+        bucket = cls.SLOT.size * cls.BUCKET
+        return max(1, size // bucket) * bucket
+    
+    def new_generation(self):
+        """Forget every entry at once; old slots count as empty from now on"""
+        self.generation = (self.generation + 1) & 0xFFFF
+        self.count = 0
+    
+    def _live(self, fields):
+        return fields[6] & self.OCCUPIED and fields[7] == self.generation
+    
+    def _less_valuable(self, fields, other):
+        if self.policy == 'depth':
+            return (fields[2], fields[3], -fields[4]) > (other[2], other[3], -other[4])
+        return (fields[4], -fields[2]) < (other[4], -other[2])
+    
+    def get(self, key, default=None):
+        slot = self.SLOT
+        for level, buffer in enumerate(self.levels):
+            start = key % (len(buffer) // (slot.size * self.BUCKET)) * slot.size * self.BUCKET
+            for offset in range(start, start + slot.size * self.BUCKET, slot.size):
+                fields = slot.unpack_from(buffer, offset)
+                if not self._live(fields):
+                    break  # Buckets fill up front to back and never lose entries
+                if fields[0] == key:
+                    self.hits += 1
+                    if level == 0 and fields[4] < 0xFFFF:
+                        struct.pack_into('<H', buffer, offset + 24, fields[4] + 1)
+                    move = DIRECTIONS[fields[5]] if fields[5] < len(DIRECTIONS) else None
+                    return (fields[2], fields[3]), fields[1] if fields[6] & self.HAS_PARENT else None, move
+        self.misses += 1
+        return default
+    
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def __setitem__(self, key, value):
+        (cost, tie_break), parent, move = value
+        flags = self.OCCUPIED | (self.HAS_PARENT if parent is not None else 0)
+        self._store(0, (key, parent or 0, cost, tie_break, 0, 255 if move is None else DIRECTIONS.index(move),
+                        flags, self.generation))
+    
+    def __len__(self):
+        return self.count
+    
+    def _store(self, level, record):
+        slot = self.SLOT
+        buffer = self.levels[level]
+        start = record[0] % (len(buffer) // (slot.size * self.BUCKET)) * slot.size * self.BUCKET
+        victim = victim_fields = None
+        for offset in range(start, start + slot.size * self.BUCKET, slot.size):
+            fields = slot.unpack_from(buffer, offset)
+            if not self._live(fields):
+                slot.pack_into(buffer, offset, *record)
+                self.count += 1
+                return
+            if fields[0] == record[0]:
+                slot.pack_into(buffer, offset, *record[:4], fields[4], *record[5:])
+                return
+            if victim is None or self._less_valuable(fields, victim_fields):
+                victim, victim_fields = offset, fields
+        
+        # Bucket full: the least valuable entry makes room, moving one level down if there is one.
+        # The count stays: the new record replaces the victim here, which is counted again below
+        # if it finds a free slot there.
+        slot.pack_into(buffer, victim, *record)
+        if level + 1 < len(self.levels):
+            self.spilled += 1
+            self._store(level + 1, victim_fields)
+        else:
+            self.evicted += 1
+    
+    def stats(self):
+        return {'table_entries': self.count, 'table_hits': self.hits, 'table_misses': self.misses,
+                'table_spilled': self.spilled, 'table_evicted': self.evicted}
+    
+    def close(self):
+        """Release the spill file, which only ever holds scratch data"""
+        if self._spill_file is not None:
+            self.levels[1].close()
+            self._spill_file.close()
+            os.remove(self.spill_path)
+            self._spill_file = None
+            del self.levels[1:]
+
+class DeadlockPatterns:
+    """Dead 3x3 neighbourhoods as a bitset over base-3 window codes (0 floor, 1 wall, 2 crate).
+    
+    A window is dead when, with no targets inside it and open floor all
+    around it, the player can never push every crate out of it. Crates
+    without a target must all leave such a window, so a matching window on
+    a real board means the position is lost.
+    """
+    MAGIC = b'BBDP'
+    VERSION = 1
+    SIZE = 3
+    _shared = None
+    
+    def __init__(self, bits, size=SIZE):
+        self.size = size
+        self.bits = bits
+    
+    @classmethod
+    def shared(cls):
+        """Patterns for the solvers: loaded from PATTERN_FILE once, or generated if it is missing"""
+        if cls._shared is None:
+            try:
+                cls._shared = cls.load(PATTERN_FILE)
+            except (OSError, ValueError) as e:
+                print(f"Deadlock patterns unavailable ({e}), generating them")
+                cls._shared = cls.generate()
+        return cls._shared
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != cls.MAGIC or len(data) < 6 or data[4] != cls.VERSION:
+            raise ValueError(f"{path} is not a deadlock pattern file")
+        size = data[5]
+        bits = data[6:]
+        if len(bits) != (3 ** (size * size) + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        return cls(bits, size)
+    
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.MAGIC + bytes([self.VERSION, self.size]) + self.bits)
+    
+    def is_dead(self, code):
+        return (self.bits[code >> 3] >> (code & 7)) & 1
+    
+    def __len__(self):
+        return sum(byte.bit_count() for byte in self.bits)
+    
+    @classmethod
+    def generate(cls, size=SIZE):
+        """Classify every window by exhaustive search"""
+        bits = bytearray((3 ** (size * size) + 7) // 8)
+        for code in range(3 ** (size * size)):
+            cells = []
+            for _ in range(size * size):
+                code, cell = divmod(code, 3)
+                cells.append(cell)
+            if cls._window_is_dead(cells, size):
+                code = sum(cell * 3 ** i for i, cell in enumerate(cells))
+                bits[code >> 3] |= 1 << (code & 7)
+        return cls(bytes(bits), size)
+    
+    @staticmethod
+    def _window_is_dead(cells, size):
+        # The window sits inside a one-cell ring of floor; a crate pushed onto the
+        # ring is gone for good, and the player can walk all around the ring
+        width = size + 2
+        walls = [False] * (width * width)
+        crates = 0
+        for i, cell in enumerate(cells):
+            index = (i // size + 1) * width + i % size + 1
+            walls[index] = cell == 1
+            if cell == 2:
+                crates |= 1 << index
+        if not crates:
+            return False
+        ring = [not (0 < index % width < width - 1 and 0 < index // width < width - 1)
+                for index in range(width * width)]
+        offsets = (-width, 1, width, -1)
+        
+        def region(player, crates):
+            seen = {player}
+            stack = [player]
+            while stack:
+                cell = stack.pop()
+                for offset in offsets:
+                    step = cell + offset
+                    if (0 <= step < width * width and step not in seen and abs(step % width - cell % width) <= 1
+                            and not walls[step] and not (crates >> step) & 1):
+                        seen.add(step)
+                        stack.append(step)
+            return seen
+        
+        # The player may start anywhere, so search from every free region at once
+        frontier = []
+        seen_states = set()
+        covered = set()
+        for start in range(width * width):
+            if walls[start] or (crates >> start) & 1 or start in covered:
+                continue
+            area = region(start, crates)
+            covered |= area
+            frontier.append((crates, area))
+            seen_states.add((crates, min(area)))
+        
+        while frontier:
+            crates, area = frontier.pop()
+            for player in area:
+                for offset in offsets:
+                    crate = player + offset
+                    # Crates only ever sit inside the window, so this also rules out stepping off the ring
+                    if not (0 <= crate < width * width and (crates >> crate) & 1):
+                        continue
+                    beyond = crate + offset
+                    if walls[beyond] or (crates >> beyond) & 1:
+                        continue
+                    moved = crates ^ (1 << crate)
+                    if not ring[beyond]:
+                        moved |= 1 << beyond
+                    elif not moved:
+                        return False
+                    new_area = region(crate, moved)
+                    key = (moved, min(new_area))
+                    if key not in seen_states:
+                        seen_states.add(key)
+                        frontier.append((moved, new_area))
+        return True
+
+class GoalRoom:
+    """Targets behind a single entrance cell, packed in a fixed order.
+    
+    The order is found backwards: starting from a full room, repeatedly pick
+    a target whose crate could have been pushed in last with every other
+    target still filled. paths[direction][k] holds the pushes that carry a
+    crate from just inside the entrance to order[k] while order[:k] is filled.
+    """
+    def __init__(self, board, cells, entrance):
+        self.board = board
+        self.cells = cells
+        self.entrance = entrance
+        self.mask = 0
+        for cell in cells:
+            self.mask |= 1 << cell
+        offsets = board.offsets
+        self.directions = [direction for direction, offset in enumerate(offsets)
+                           if entrance + offset in cells and not board.walls[entrance - offset]
+                           and entrance - offset not in cells]
+        self.order = self._packing_order()
+        self.paths = {}
+        self.prefix = {}
+        if self.order is None:
+            return
+        filled = 0
+        for k, target in enumerate(self.order):
+            self.prefix[filled] = k
+            for direction in self.directions:
+                self.paths.setdefault(direction, []).append(self._push_path(direction, target, filled))
+            filled |= 1 << target
+        self.prefix[filled] = len(self.order)
+    
+    @classmethod
+    def find(cls, board):
+        """Return the smallest room holding every target behind one entrance, or None"""
+        if not board.targets or len(board.targets) > board.crate_count:
+            return None
+        area = board.flood(board.targets[0])
+        best = None
+        for entrance in area:
+            if (board.target_mask >> entrance) & 1:
+                continue
+            cells = board.flood(board.targets[0], blocked=entrance)
+            if len(cells) + 1 >= len(area) or any(target not in cells for target in board.targets):
+                continue
+            if best is None or len(cells) < len(best[1]):
+                best = (entrance, cells)
+        if best is None:
+            return None
+        room = cls(board, best[1], best[0])
+        return room if room.order is not None and room.directions else None
+    
+    def _packing_order(self):
+        filled = set(self.board.targets)
+        order = []
+        while filled:
+            # Fill far targets first, so try the near ones as the last crate in
+            for target in sorted(filled, key=lambda t: self.board.push_distance[self.board.targets.index(t)]
+                                 [self.entrance]):
+                others = 0
+                for cell in filled:
+                    if cell != target:
+                        others |= 1 << cell
+                if any(self._push_path(direction, target, others) is not None for direction in self.directions):
+                    order.append(target)
+                    filled.remove(target)
+                    break
+            else:
+                return None
+        order.reverse()
+        return order
+    
+    def _push_path(self, direction, target, filled):
+        """Pushes taking one crate from inside the entrance to target past the filled crates, or None"""
+        board = self.board
+        offsets = board.offsets
+        allowed = self.cells | {self.entrance}
+        
+        def region(player, crate):
+            seen = {player}
+            stack = [player]
+            while stack:
+                cell = stack.pop()
+                for offset in offsets:
+                    step = cell + offset
+                    if step in allowed and step not in seen and step != crate and not (filled >> step) & 1:
+                        seen.add(step)
+                        stack.append(step)
+            return seen
+        
+        start = self.entrance + offsets[direction]
+        if (filled >> start) & 1:
+            return None
+        area = region(self.entrance, start)
+        came_from = {(start, min(area)): None}
+        queue = deque([(start, area)])
+        while queue:
+            crate, area = queue.popleft()
+            if crate == target:
+                pushes = []
+                key = (crate, min(area))
+                while came_from[key] is not None:
+                    key, push = came_from[key]
+                    pushes.append(push)
+                pushes.reverse()
+                return pushes
+            for push_direction, offset in enumerate(offsets):
+                beyond = crate + offset
+                if crate - offset not in area or beyond not in self.cells or (filled >> beyond) & 1:
+                    continue
+                new_area = region(crate, beyond)
+                key = (beyond, min(new_area))
+                if key not in came_from:
+                    came_from[key] = ((crate, min(area)), (crate, push_direction))
+                    queue.append((beyond, new_area))
+        return None
+
+class LevelBoard:
+    """Static level data (walls, targets, lookup tables) shared by every CompactState of a level"""
+    _cache = {}
+    
+    def __init__(self, grid, targets_pos, crate_count):
+        self.grid_width = max(len(row) for row in grid)
+        self.grid_height = len(grid)
+        
+        # Pad the board with a ring of walls so moves never need bounds checks
+        self.width = self.grid_width + 2
+        self.height = self.grid_height + 2
+        self.size = self.width * self.height
+        walls = bytearray(b'\x01' * self.size)
+        for y, row in enumerate(grid):
+            for x, cell in enumerate(row):
+                if cell != WALL:
+                    walls[self.index(x, y)] = 0
+        self.walls = bytes(walls)
+        self.offsets = tuple(dy * self.width + dx for dx, dy in DIRECTIONS)
+        
+        self.targets = [self.index(x, y) for x, y in targets_pos]
+        self.target_mask = 0
+        for cell in self.targets:
+            self.target_mask |= 1 << cell
+        self.crate_count = crate_count
+        self.goal_count = min(crate_count, len(self.targets))
+        self.zobrist = ZobristTable(self.size)
+        
+        # With spare crates some may legitimately end up anywhere, so single
+        # dead crates are only fatal when crates and targets can all be matched
+        self.spare_crates = crate_count > len(self.targets)
+        self._build_push_distances()
+        self._build_pattern_windows()
+        self._build_macros()
+    
+    @classmethod
+    def for_level(cls, grid, targets_pos, crate_count):
+        """Return the shared board for a level, building it only once"""
+        key = (tuple(''.join(row) for row in grid), tuple(map(tuple, targets_pos)), crate_count)
+        board = cls._cache.get(key)
+        if board is None:
+            board = cls._cache[key] = cls(grid, targets_pos, crate_count)
+        return board
+    
+    def index(self, x, y):
+        return (y + 1) * self.width + x + 1
+    
+    def position(self, cell):
+        return cell % self.width - 1, cell // self.width - 1
+    
+    def _build_push_distances(self):
+        """Push distances from every cell to every target, plus the dead squares they imply"""
+        # Unreachable pairs get a finite cost larger than any sum of real
+        # distances, which keeps the assignment bound a valid lower bound and
+        # makes a bound of at least this much prove that no matching exists
+        self.unreachable = self.size * max(self.crate_count, len(self.targets), 1)
+        self.push_distance = []
+        for target in self.targets:
+            # Pull a lone crate backwards from the target: a crate at cell can be
+            # pulled to cell + offset when the player has room to stand and step back
+            distance = [self.unreachable] * self.size
+            distance[target] = 0
+            queue = deque([target])
+            while queue:
+                cell = queue.popleft()
+                for offset in self.offsets:
+                    pulled = cell + offset
+                    if distance[pulled] != self.unreachable or self.walls[pulled] or self.walls[pulled + offset]:
+                        continue
+                    distance[pulled] = distance[cell] + 1
+                    queue.append(pulled)
+            self.push_distance.append(distance)
+        
+        self.target_distance = [min(column, default=0) for column in zip(*self.push_distance)] or [0] * self.size
+        self.dead_squares = bytearray(not self.walls[cell] and self.target_distance[cell] == self.unreachable
+                                      for cell in range(self.size))
+        self.dead_mask = 0
+        for cell in range(self.size):
+            if self.dead_squares[cell]:
+                self.dead_mask |= 1 << cell
+        self._distance_rows = {}
+    
+    def _build_pattern_windows(self):
+        """For every cell, the target-free 3x3 windows around it as (wall code, crate slots)"""
+        self.patterns = None
+        self.pattern_windows = {}
+        if self.spare_crates:
+            return  # Spare crates may legitimately stay anywhere
+        self.patterns = DeadlockPatterns.shared()
+        size = self.patterns.size
+        for top in range(self.height - size + 1):
+            for left in range(self.width - size + 1):
+                cells = [(top + dy) * self.width + left + dx for dy in range(size) for dx in range(size)]
+                if any((self.target_mask >> cell) & 1 for cell in cells):
+                    continue
+                walls = sum(3 ** i for i, cell in enumerate(cells) if self.walls[cell])
+                slots = tuple((cell, 2 * 3 ** i) for i, cell in enumerate(cells) if not self.walls[cell])
+                for cell, _ in slots:
+                    self.pattern_windows.setdefault(cell, []).append((walls, slots))
+    
+    def _build_macros(self):
+        """Tunnel cells for each push axis, and the goal room if the targets sit behind one entrance"""
+        # tunnel[axis][cell]: walls on both sides across the axis of pushes (0 vertical, 1 horizontal)
+        self.tunnel = []
+        for axis in range(2):
+            side, other_side = self.offsets[1 - axis], self.offsets[3 - axis]
+            self.tunnel.append(bytearray(not self.walls[cell] and self.walls[cell + side]
+                                         and self.walls[cell + other_side]
+                                         if 0 < cell % self.width < self.width - 1
+                                         and self.width <= cell < self.size - self.width else 0
+                                         for cell in range(self.size)))
+        self.goal_room = GoalRoom.find(self)
+    
+    def flood(self, start, blocked=None):
+        """Set of non-wall cells connected to start, not passing through blocked"""
+        seen = {start}
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            for offset in self.offsets:
+                step = cell + offset
+                if step not in seen and step != blocked and not self.walls[step]:
+                    seen.add(step)
+                    stack.append(step)
+        return seen
+    
+    def distance_row(self, cell):
+        """Push distances from cell to every target, padded with zero-cost dummy targets"""
+        row = self._distance_rows.get(cell)
+        if row is None:
+            padding = max(0, self.crate_count - len(self.targets))
+            row = tuple(distance[cell] for distance in self.push_distance) + (0,) * padding
+            self._distance_rows[cell] = row
+        return row
+    
+    def push_is_deadlock(self, crates, cell):
+        """Check whether a crate just pushed onto cell makes the position unsolvable"""
+        if not self.spare_crates:
+            if self.dead_squares[cell]:
+                return True
+            # Any newly dead window has to contain the crate that just moved
+            patterns = self.patterns
+            for code, slots in self.pattern_windows.get(cell, ()):
+                for slot, weight in slots:
+                    if (crates >> slot) & 1:
+                        code += weight
+                if patterns.is_dead(code):
+                    return True
+            stuck = self._stuck_crates(crates, cell)
+            return any(not (self.target_mask >> stuck_cell) & 1 for stuck_cell in stuck)
+        
+        # Spare crates: prune only when too few crates can still reach a target
+        stuck = self.dead_mask
+        for stuck_cell in self._stuck_crates(crates, cell):
+            if not (self.target_mask >> stuck_cell) & 1:
+                stuck |= 1 << stuck_cell
+        return self.crate_count - (crates & stuck).bit_count() < self.goal_count
+    
+    def _stuck_crates(self, crates, cell):
+        """Return the crates around cell that can never move again (2x2 blocks and frozen groups)"""
+        walls = self.walls
+        
+        # 2x2 squares of walls and crates
+        up, right, down, left = self.offsets
+        for corner in (cell, cell + left, cell + up, cell + up + left):
+            block = (corner, corner + right, corner + down, corner + down + right)
+            if all(walls[c] or (crates >> c) & 1 for c in block):
+                return [c for c in block if (crates >> c) & 1]
+        
+        frozen = []
+        if self._is_frozen(crates, cell, set(), frozen):
+            return frozen
+        return []
+    
+    def _is_frozen(self, crates, cell, visited, frozen):
+        """A crate is frozen when it is blocked on both axes by walls or other frozen crates"""
+        visited.add(cell)
+        for offset in self.offsets[:2]:
+            if not self._blocked_on_axis(crates, cell, offset, visited, frozen):
+                return False
+        frozen.append(cell)
+        return True
+    
+    def _blocked_on_axis(self, crates, cell, offset, visited, frozen):
+        before, after = cell - offset, cell + offset
+        if self.walls[before] or self.walls[after]:
+            return True
+        # Between two dead squares the crate can only move onto a dead square
+        if not self.spare_crates and self.dead_squares[before] and self.dead_squares[after]:
+            return True
+        # Crates already being examined count as walls
+        for neighbour in (before, after):
+            if neighbour in visited:
+                return True
+            if (crates >> neighbour) & 1 and self._is_frozen(crates, neighbour, visited, frozen):
+                return True
+        return False
+
+class AssignmentBound:
+    """Minimum-cost crate-to-target matching over push distances, repaired incrementally.
+    
+    The matrix is made square with zero-cost dummy rows or columns, so spare
+    crates or spare targets simply match a dummy. Crate rows keep their
+    Hungarian potentials, so moving one crate only needs a single augmenting
+    path instead of a full re-solve.
+    """
+    __slots__ = ('board', 'rows', 'row_of_cell', 'u', 'v', 'col_row', 'row_col', 'cost')
+    
+    def __init__(self, board, crates=None):
+        self.board = board
+        if crates is None:
+            return  # Filled in by copy()
+        n = max(board.crate_count, len(board.targets))
+        self.rows = [board.distance_row(cell) for cell in iter_cells(crates)]
+        self.rows.extend([(0,) * n] * (n - len(self.rows)))
+        self.row_of_cell = {cell: row for row, cell in enumerate(iter_cells(crates))}
+        self.u = [0] * n
+        self.v = [0] * n
+        self.col_row = [-1] * n
+        self.row_col = [-1] * n
+        for row in range(n):
+            self._augment(row)
+        self.cost = sum(cost_row[col] for cost_row, col in zip(self.rows, self.row_col))
+    
+    def copy(self):
+        bound = AssignmentBound(self.board)
+        bound.rows = self.rows[:]
+        bound.row_of_cell = dict(self.row_of_cell)
+        bound.u = self.u[:]
+        bound.v = self.v[:]
+        bound.col_row = self.col_row[:]
+        bound.row_col = self.row_col[:]
+        bound.cost = self.cost
+        return bound
+    
+    def moved(self, old_cell, new_cell):
+        """Return the bound after one crate moved from old_cell to new_cell"""
+        bound = self.copy()
+        row = bound.row_of_cell.pop(old_cell)
+        bound.row_of_cell[new_cell] = row
+        costs = bound.rows[row] = self.board.distance_row(new_cell)
+        
+        # Free the row and lower its potential until every reduced cost is non-negative again
+        col = bound.row_col[row]
+        bound.col_row[col] = -1
+        bound.row_col[row] = -1
+        v = bound.v
+        bound.u[row] = min(costs[j] - v[j] for j in range(len(v)))
+        bound._augment(row)
+        bound.cost = sum(cost_row[col] for cost_row, col in zip(bound.rows, bound.row_col))
+        return bound
+    
+    def _augment(self, start_row):
+        """Match start_row along a shortest augmenting path (one Hungarian phase)"""
+        n = len(self.u)
+        u, v, rows, col_row = self.u, self.v, self.rows, self.col_row
+        min_slack = [float('inf')] * n
+        previous = [-1] * n
+        used = [False] * n
+        used_cols = []
+        row, col = start_row, -1
+        while True:
+            delta = float('inf')
+            next_col = -1
+            costs, u_row = rows[row], u[row]
+            for j in range(n):
+                if not used[j]:
+                    slack = costs[j] - u_row - v[j]
+                    if slack < min_slack[j]:
+                        min_slack[j] = slack
+                        previous[j] = col
+                    if min_slack[j] < delta:
+                        delta = min_slack[j]
+                        next_col = j
+            u[start_row] += delta
+            for j in used_cols:
+                u[col_row[j]] += delta
+                v[j] -= delta
+            for j in range(n):
+                if not used[j]:
+                    min_slack[j] -= delta
+            used[next_col] = True
+            used_cols.append(next_col)
+            col = next_col
+            if col_row[col] == -1:
+                break
+            row = col_row[col]
+        
+        # Flip the matching along the path back to start_row
+        while col != -1:
+            prev_col = previous[col]
+            row = col_row[prev_col] if prev_col != -1 else start_row
+            col_row[col] = row
+            self.row_col[row] = col
+            col = prev_col
+
+class CompactState:
+    """Hashable solver state: player cell plus a crate bitset over a shared LevelBoard"""
+    __slots__ = ('board', 'player', 'crates', 'zkey', 'move_count', '_bound', '_moved')
+    
+    def __init__(self, board, player, crates, move_count=0, zkey=None, bound=None, moved=None):
+        self.board = board
+        self.player = player
+        self.crates = crates
+        self.move_count = move_count
+        self.zkey = board.zobrist.hash_cells(player, crates) if zkey is None else zkey
+        # The parent's AssignmentBound and the crate move still to apply to it, resolved lazily
+        self._bound = bound
+        self._moved = moved
+    
+    @classmethod
+    def from_state(cls, state):
+        """Convert a GameState (a CompactState is returned unchanged)"""
+        if isinstance(state, CompactState):
+            return state
+        board = state.board
+        crates = 0
+        for x, y in state.crates_pos:
+            crates |= 1 << board.index(x, y)
+        return cls(board, board.index(*state.player_pos), crates, state.move_count)
+    
+    def to_game_state(self):
+        grid = [[WALL if self.board.walls[self.board.index(x, y)] else FLOOR
+                 for x in range(self.board.grid_width)] for y in range(self.board.grid_height)]
+        return GameState(grid, list(self.board.position(self.player)),
+                         [list(self.board.position(cell)) for cell in iter_cells(self.crates)],
+                         [list(self.board.position(cell)) for cell in self.board.targets],
+                         self.move_count, self.board)
+    
+    @property
+    def player_pos(self):
+        return list(self.board.position(self.player))
+    
+    @property
+    def crates_pos(self):
+        return [list(self.board.position(cell)) for cell in iter_cells(self.crates)]
+    
+    def __eq__(self, other):
+        return self.player == other.player and self.crates == other.crates
+    
+    def __hash__(self):
+        return self.zkey
+    
+    def copy(self):
+        # States are immutable, so sharing is safe
+        return self
+    
+    def push_lower_bound(self, cache=True):
+        """Minimum-cost crate-to-target matching over push distances.
+        
+        With cache=False a pending update is computed but not kept, so states
+        waiting in a search frontier only reference their parent's bound.
+        """
+        if self._bound is None:
+            bound = AssignmentBound(self.board, self.crates)
+        elif self._moved is not None:
+            bound = self._bound.moved(*self._moved)
+        else:
+            return self._bound.cost
+        if cache:
+            self._bound = bound
+            self._moved = None
+        return bound.cost
+    
+    def evaluate(self):
+        """Same scoring as GameState.evaluate(), using the board's lookup tables"""
+        if self.is_solved():
+            return -self.move_count
+        
+        board = self.board
+        crates = self.crates
+        total_distance = self.push_lower_bound()
+        deadlock_penalty = (crates & board.dead_mask).bit_count() * 1000
+        
+        # Horizontally and vertically adjacent crate pairs
+        adjacent = (crates & (crates >> 1)).bit_count() + (crates & (crates >> board.width)).bit_count()
+        blocking_penalty = adjacent * 10
+        
+        return total_distance + deadlock_penalty + blocking_penalty + self.move_count * 2
+    
+    def is_solved(self):
+        return (self.crates & self.board.target_mask).bit_count() == self.board.goal_count
+    
+    def get_possible_moves(self):
+        """Get all possible moves from current state"""
+        return [direction for direction, _, _ in self.successors()]
+    
+    def successors(self):
+        """Yield (move, new state, pushed) for every legal move"""
+        board = self.board
+        walls = board.walls
+        crates = self.crates
+        keys = board.zobrist
+        for direction, offset in zip(DIRECTIONS, board.offsets):
+            step = self.player + offset
+            if walls[step]:
+                continue
+            zkey = self.zkey ^ keys.player_keys[self.player] ^ keys.player_keys[step]
+            if (crates >> step) & 1:
+                beyond = step + offset
+                if walls[beyond] or (crates >> beyond) & 1:
+                    continue
+                new_crates = crates ^ (1 << step) ^ (1 << beyond)
+                if board.push_is_deadlock(new_crates, beyond):
+                    continue
+                zkey ^= keys.crate_keys[step] ^ keys.crate_keys[beyond]
+                yield direction, CompactState(board, step, new_crates, self.move_count + 1, zkey,
+                                              self._settled_bound(), (step, beyond)), True
+            else:
+                yield direction, CompactState(board, step, crates, self.move_count + 1, zkey,
+                                              self._bound, self._moved), False
+    
+    def apply_move(self, dx, dy):
+        """Apply a move and return new state"""
+        board = self.board
+        keys = board.zobrist
+        step = self.player + board.offsets[DIRECTIONS.index((dx, dy))]
+        crates = self.crates
+        zkey = self.zkey ^ keys.player_keys[self.player] ^ keys.player_keys[step]
+        if (crates >> step) & 1:
+            beyond = step + step - self.player
+            crates ^= (1 << step) | (1 << beyond)
+            zkey ^= keys.crate_keys[step] ^ keys.crate_keys[beyond]
+            return CompactState(board, step, crates, self.move_count + 1, zkey,
+                                self._settled_bound(), (step, beyond))
+        return CompactState(board, step, crates, self.move_count + 1, zkey, self._bound, self._moved)
+    
+    def _settled_bound(self):
+        """This state's bound with any pending crate move applied, if one was ever computed"""
+        if self._bound is not None and self._moved is not None:
+            self.push_lower_bound()
+        return self._bound
+    
+    def reachable(self):
+        """Breadth-first walk from the player; returns (distance per cell, -1 if unreachable), lowest reachable cell)"""
+        board = self.board
+        walls, crates, offsets = board.walls, self.crates, board.offsets
+        distance = [-1] * board.size
+        distance[self.player] = 0
+        queue = deque([self.player])
+        lowest = self.player
+        while queue:
+            cell = queue.popleft()
+            if cell < lowest:
+                lowest = cell
+            for offset in offsets:
+                step = cell + offset
+                if distance[step] < 0 and not walls[step] and not (crates >> step) & 1:
+                    distance[step] = distance[cell] + 1
+                    queue.append(step)
+        return distance, lowest
+    
+    def normalized_key(self, lowest):
+        """Zobrist key with the player moved to the lowest cell of its region"""
+        keys = self.board.zobrist.player_keys
+        return self.zkey ^ keys[self.player] ^ keys[lowest]
+    
+    def push_successors(self, distance=None):
+        """Yield (crate cell, direction index, new state) for every push the player can walk to"""
+        if distance is None:
+            distance, _ = self.reachable()
+        board = self.board
+        walls, crates = board.walls, self.crates
+        keys = board.zobrist
+        bound = self._settled_bound()
+        for cell in iter_cells(crates):
+            for direction, offset in enumerate(board.offsets):
+                walk = distance[cell - offset]
+                beyond = cell + offset
+                if walk < 0 or walls[beyond] or (crates >> beyond) & 1:
+                    continue
+                new_crates = crates ^ (1 << cell) ^ (1 << beyond)
+                if board.push_is_deadlock(new_crates, beyond):
+                    continue
+                zkey = (self.zkey ^ keys.player_keys[self.player] ^ keys.player_keys[cell]
+                        ^ keys.crate_keys[cell] ^ keys.crate_keys[beyond])
+                yield cell, direction, CompactState(board, cell, new_crates, self.move_count + walk + 1, zkey,
+                                                    bound, (cell, beyond))
+    
+    def pull_successors(self, distance=None, allowed=None):
+        """Yield (crate cell, direction index, new state) for every pull, the reverse of a push.
+        
+        The player stands on the cell the crate moves into and steps back one
+        more cell. allowed, if given, lists per cell whether crates may end up there.
+        """
+        if distance is None:
+            distance, _ = self.reachable()
+        board = self.board
+        walls, crates = board.walls, self.crates
+        keys = board.zobrist
+        for cell in iter_cells(crates):
+            for direction, offset in enumerate(board.offsets):
+                pulled = cell + offset
+                back = pulled + offset
+                if distance[pulled] < 0 or walls[back] or (crates >> back) & 1:
+                    continue
+                if allowed is not None and not allowed[pulled]:
+                    continue
+                zkey = (self.zkey ^ keys.player_keys[self.player] ^ keys.player_keys[back]
+                        ^ keys.crate_keys[cell] ^ keys.crate_keys[pulled])
+                yield cell, direction, CompactState(board, back, crates ^ (1 << cell) ^ (1 << pulled),
+                                                    self.move_count + distance[pulled] + 1, zkey)
+    
+    def is_hopeless(self):
+        """Cheap proof that no solution exists: targets no crate can reach, or walled off from the player"""
+        return self.push_lower_bound() >= self.board.unreachable or self.targets_sealed_off()
+    
+    def targets_sealed_off(self):
+        """True when walls keep the player away from more targets than the level can spare"""
+        # Crates outside the player's walled-in area never move and nothing can enter it
+        board = self.board
+        area = board.flood(self.player)
+        movable = sum(1 for cell in iter_cells(self.crates) if cell in area)
+        open_targets = sum(1 for target in board.targets if target in area)
+        fixed_on_target = sum(1 for target in board.targets if target not in area and (self.crates >> target) & 1)
+        return fixed_on_target + min(movable, open_targets) < board.goal_count
+    
+    def macro_push_successors(self, distance=None):
+        """Yield (pushes, new state) like push_successors, merging forced push sequences into one step.
+        
+        A crate pushed along a tunnel, with the player following it, keeps
+        going until it leaves the tunnel. Once the goal room holds crates on
+        a prefix of its packing order, those crates stay put and a crate
+        pushed through the entrance goes straight to the next target.
+        """
+        board = self.board
+        walls, offsets, tunnel = board.walls, board.offsets, board.tunnel
+        room = board.goal_room
+        packed = None
+        if room is not None:
+            packed = room.prefix.get(self.crates & room.mask)
+        
+        for cell, direction, child in self.push_successors(distance):
+            if packed is not None and (room.mask >> cell) & 1:
+                continue
+            pushes = [(cell, direction)]
+            
+            if packed is not None and cell == room.entrance and packed < len(room.order):
+                path = room.paths.get(direction, [None] * len(room.order))[packed]
+                if path is not None:
+                    pushes.extend(path)
+                    yield pushes, child._after_pushes(cell, path)
+                    continue
+            
+            axis = direction & 1
+            offset = offsets[direction]
+            player, crate, crates = cell, cell + offset, child.crates
+            while (tunnel[axis][player] and tunnel[axis][crate] and not (board.target_mask >> crate) & 1
+                   and (room is None or crate != room.entrance)):
+                beyond = crate + offset
+                if walls[beyond] or (crates >> beyond) & 1:
+                    break
+                new_crates = crates ^ (1 << crate) ^ (1 << beyond)
+                if board.push_is_deadlock(new_crates, beyond):
+                    break
+                pushes.append((crate, direction))
+                player, crate, crates = crate, beyond, new_crates
+            if len(pushes) > 1:
+                child = child._after_pushes(cell, pushes[1:])
+            yield pushes, child
+    
+    def _after_pushes(self, origin, pushes):
+        """State after further pushes of the crate that just left origin; walks count as nothing"""
+        if not pushes:
+            return self
+        keys = self.board.zobrist
+        offsets = self.board.offsets
+        player, crates, zkey = self.player, self.crates, self.zkey
+        for cell, direction in pushes:
+            beyond = cell + offsets[direction]
+            crates ^= (1 << cell) ^ (1 << beyond)
+            zkey ^= keys.player_keys[player] ^ keys.player_keys[cell] ^ keys.crate_keys[cell] ^ keys.crate_keys[beyond]
+            player = cell
+        return CompactState(self.board, player, crates, self.move_count + len(pushes), zkey,
+                            self._bound, (origin, beyond))
+    
+    def walk_to(self, goal):
+        """Shortest list of non-pushing moves taking the player to goal, or None"""
+        board = self.board
+        walls, crates = board.walls, self.crates
+        came_from = {self.player: None}
+        queue = deque([self.player])
+        while queue:
+            cell = queue.popleft()
+            if cell == goal:
+                path = []
+                while came_from[cell] is not None:
+                    cell, direction = came_from[cell]
+                    path.append(DIRECTIONS[direction])
+                path.reverse()
+                return path
+            for direction, offset in enumerate(board.offsets):
+                step = cell + offset
+                if step not in came_from and not walls[step] and not (crates >> step) & 1:
+                    came_from[step] = (cell, direction)
+                    queue.append(step)
+        return None
+    
+    def pushes_to_moves(self, pushes):
+        """Expand a list of (crate cell, direction index) pushes into single moves, walking in between"""
+        moves = []
+        state = self
+        for cell, direction in pushes:
+            walk = state.walk_to(cell - self.board.offsets[direction])
+            if walk is None:
+                raise ValueError(f"Push of crate {self.board.position(cell)} is not reachable")
+            moves.extend(walk)
+            moves.append(DIRECTIONS[direction])
+            for dx, dy in walk:
+                state = state.apply_move(dx, dy)
+            state = state.apply_move(*DIRECTIONS[direction])
+        return moves
+
+class SolverMetrics:
+    """Counters, peak values and phase timers of one solver run, passed on to observers.
+    
+    Observers are callables taking (event, data), where event is 'progress',
+    'solution' or 'finish' and data is a snapshot(). Solvers keep hot-loop
+    counts in local variables and only hand them over when they report.
+    """
+    def __init__(self, observers=()):
+        self.observers = list(observers)
+        self.counters = {}
+        self.peaks = {}
+        self.timers = {}
+        self.start = time.perf_counter()
+    
+    def update(self, **counters):
+        """Set counters to the solver's running totals"""
+        self.counters.update(counters)
+    
+    def peak(self, name, value):
+        if value > self.peaks.get(name, 0):
+            self.peaks[name] = value
+    
+    def add_time(self, phase, seconds):
+        self.timers[phase] = self.timers.get(phase, 0) + seconds
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a block of work as one phase, e.g. the search or expanding pushes into moves"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+    
+    def snapshot(self):
+        counters = dict(self.counters)
+        if counters.get('moves_proposed'):
+            counters['acceptance_ratio'] = round(counters.get('moves_accepted', 0) / counters['moves_proposed'], 4)
+        return {
+            'elapsed': round(time.perf_counter() - self.start, 6),
+            'counters': counters,
+            'peaks': dict(self.peaks),
+            'timers': {phase: round(seconds, 6) for phase, seconds in self.timers.items()},
+        }
+    
+    def emit(self, event, **fields):
+        if not self.observers:
+            return
+        data = self.snapshot()
+        data.update(fields)
+        for observer in self.observers:
+            observer(event, data)
+
+class JsonLinesWriter:
+    """Metrics observer appending one JSON object per event to a file; context fields go into every line"""
+    def __init__(self, path, **context):
+        self.file = open(path, "a", buffering=1)
+        self.context = context
+    
+    def __call__(self, event, data):
+        self.file.write(json.dumps({'event': event, **self.context, **data}) + "\n")
+    
+    def close(self):
+        self.file.close()
+
+def profile_solver(solver, output=None, limit=20, deadline=None):
+    """Run solver.solve() under cProfile and print the costliest functions to stderr.
+    
+    With output the raw profile is saved too, for pstats or snakeviz.
+    """
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    path = profiler.runcall(solver.solve, deadline=deadline)
+    if output:
+        profiler.dump_stats(output)
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(limit)
+    return path
+
+class _AnyEvent:
+    """Reads as set once any of its events is set, for a solver that answers to two cancel events"""
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+    
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+class SolverBase:
+    """Progress, solution and cancellation hooks shared by every solver"""
+    iterations = 0       # Units of search work done: annealing steps or expanded nodes
+    on_progress = None   # Called with {'iterations', 'best_cost', 'best_length'} now and then
+    on_solution = None   # Called with each new best list of moves as soon as it is found
+    cancel_event = None  # threading/multiprocessing Event; once set the solver stops early
+    deadline = None      # time.monotonic() value at which the solver stops early, set by solve()
+    metrics = None       # SolverMetrics, only collected once observe() was called
+    
+    def attach(self, on_progress=None, on_solution=None, cancel_event=None):
+        """Hook the solver up to a caller, e.g. a SolverWorker running it in the background"""
+        self.on_progress = on_progress
+        self.on_solution = on_solution
+        self.cancel_event = cancel_event
+    
+    def cancelled(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.cancel_event is not None and self.cancel_event.is_set()
+    
+    def iter_solutions(self, deadline=None):
+        """Run solve() in the background and yield every improved solution as soon as it is found.
+        
+        Each item is a dict with the moves, their cost (the move count) and
+        the seconds elapsed since the start. Closing the generator early
+        cancels the search. Hooks attached before keep working meanwhile
+        and are restored afterwards.
+        """
+        found = queue.Queue()
+        finished = object()
+        cancel_event = threading.Event()
+        previous_solution, previous_cancel = self.on_solution, self.cancel_event
+        
+        def on_solution(path):
+            found.put(path)
+            if previous_solution is not None:
+                previous_solution(path)
+        
+        self.attach(self.on_progress, on_solution, _AnyEvent(previous_cancel, cancel_event))
+        
+        def run():
+            try:
+                path = self.solve(deadline=deadline)
+                if path:
+                    found.put(path)
+            finally:
+                found.put(finished)
+        
+        start = time.monotonic()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        best = None
+        try:
+            while True:
+                path = found.get()
+                if path is finished:
+                    break
+                if best is None or len(path) < best:
+                    best = len(path)
+                    yield {'moves': list(path), 'cost': len(path), 'elapsed': time.monotonic() - start}
+        finally:
+            cancel_event.set()
+            thread.join()
+            self.attach(self.on_progress, previous_solution, previous_cancel)
+    
+    def observe(self, observer=None):
+        """Start collecting metrics, also passing every report to observer; returns the SolverMetrics"""
+        if self.metrics is None:
+            self.metrics = SolverMetrics()
+        if observer is not None:
+            self.metrics.observers.append(observer)
+        return self.metrics
+    
+    def phase(self, name):
+        """Context manager timing a phase of the solve, free when nobody observes"""
+        return self.metrics.phase(name) if self.metrics is not None else contextlib.nullcontext()
+    
+    def report_progress(self, iterations, best_cost, best_length=None):
+        if self.on_progress is not None:
+            self.on_progress({'iterations': iterations, 'best_cost': best_cost, 'best_length': best_length})
+        if self.metrics is not None:
+            self.metrics.emit('progress', iterations=iterations, best_cost=best_cost, best_length=best_length)
+    
+    def report_solution(self, path):
+        if self.on_solution is not None:
+            self.on_solution(list(path))
+        if self.metrics is not None:
+            self.metrics.emit('solution', iterations=self.iterations, length=len(path))
+    
+    def record_search(self, stored, frontier=0, generated=None):
+        """Hand a search's totals to the metrics: states kept in memory, waiting and generated so far"""
+        if self.metrics is not None:
+            self.metrics.update(nodes_expanded=self.iterations)
+            if generated is not None:
+                self.metrics.update(states_generated=generated)
+            self.metrics.peak('stored_states', stored)
+            self.metrics.peak('frontier', frontier)
+    
+    def report_finished(self, path):
+        if self.metrics is not None:
+            self.metrics.emit('finish', solver=type(self).__name__, iterations=self.iterations,
+                              solved=bool(path), length=len(path) if path else None)
+
+class SimulatedAnnealingSolver(SolverBase):
+    def __init__(self, initial_state, max_iterations=5000, initial_temp=1000, cooling_rate=0.995, max_moves=50,
+                 seed=None, shared_best=None, cancel_event=None, verbose=True):
+        self.initial_state = CompactState.from_state(initial_state)
         self.max_iterations = max_iterations
         self.initial_temp = initial_temp
         self.cooling_rate = cooling_rate
         self.max_moves = max_moves  # Prevent extremely long solutions
+        self.rng = random.Random(seed)
+        self.shared_best = shared_best  # Optional multiprocessing.Value with the best length found by any chain
+        self.cancel_event = cancel_event  # Optional event that stops the search early
+        self.verbose = verbose
         self.solution_path = []
         self.best_solution = None
         self.best_move_count = float('inf')
     
-    def solve(self):
-        """Solve using simulated annealing - optimized for shortest path"""
-        current_state = self.initial_state.copy()
-        current_cost = current_state.evaluate()
-        
-        best_state = current_state.copy()
-        best_cost = current_cost
-        
-        temperature = self.initial_temp
-        path = []
-        
-        print(f"Starting solver with initial cost: {current_cost}")
-        print(f"Looking for solution with minimal moves...")
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+    
+    def _move_limit(self):
+        """Longest path worth extending, given our own and the other chains' best solutions"""
+        limit = min(self.max_moves, self.best_move_count - 1)
+        if self.shared_best is not None:
+            limit = min(limit, self.shared_best.value - 1)
+        return limit
+    
+    def _publish(self, move_count):
+        if self.shared_best is not None:
+            with self.shared_best.get_lock():
+                if move_count < self.shared_best.value:
+                    self.shared_best.value = move_count
+    
+    def solve(self, deadline=None):
+        """Solve using simulated annealing - optimized for shortest path"""
+        self.deadline = deadline
+        current_state = self.initial_state.copy()
+        current_cost = current_state.evaluate()
+        
+        best_state = current_state.copy()
+        best_cost = current_cost
+        
+        temperature = self.initial_temp
+        path = []
+        # Plain local counters, handed to self.metrics only when progress is reported
+        evaluations, copies, generated, restarts = 1, 2, 0, 0
+        proposed, accepted, worse_accepted, longest_path = 0, 0, 0, 0
+        search_start = time.perf_counter()
+        
+        def record_metrics():
+            self.metrics.update(evaluate_calls=evaluations, state_copies=copies, moves_generated=generated,
+                                restarts=restarts, moves_proposed=proposed, moves_accepted=accepted,
+                                worse_moves_accepted=worse_accepted)
+            self.metrics.peak('path_length', longest_path)
+        
+        self._log(f"Starting solver with initial cost: {current_cost}")
+        self._log(f"Looking for solution with minimal moves...")
+        
+        for iteration in range(self.max_iterations):
+            self.iterations = iteration + 1
+            if iteration % 100 == 0 and self.cancelled():
+                break
+            
+            # Check if we found a solution
+            if current_state.is_solved():
+                move_count = len(path)
+                self._log(f"Solution found in {iteration} iterations with {move_count} moves!")
+                
+                # Keep track of the best (shortest) solution found
+                if move_count < self.best_move_count:
+                    self.best_move_count = move_count
+                    self.best_solution = path[:]
+                    self._publish(move_count)
+                    self.report_solution(self.best_solution)
+                    self._log(f"New best solution: {move_count} moves!")
+                
+                # Continue searching for better solutions unless we're at max iterations
+                if iteration < self.max_iterations * 0.8:  # Keep searching for 80% of iterations
+                    # Restart from beginning with different random seed
+                    current_state = self.initial_state.copy()
+                    current_cost = current_state.evaluate()
+                    evaluations, copies, restarts = evaluations + 1, copies + 1, restarts + 1
+                    path = []
+                    temperature = self.initial_temp * 0.8  # Slightly lower temperature
+                    continue
+                else:
+                    break
+            
+            # Prevent overly long solutions, and paths already longer than a known solution
+            if len(path) > self._move_limit():
+                # Restart with a fresh state
+                current_state = self.initial_state.copy()
+                current_cost = current_state.evaluate()
+                evaluations, copies, restarts = evaluations + 1, copies + 1, restarts + 1
+                path = []
+                temperature = self.initial_temp * 0.5
+                continue
+            
+            # Get possible moves
+            possible_moves = current_state.get_possible_moves()
+            generated += len(possible_moves)
+            if not possible_moves:
+                # Dead end - restart
+                current_state = self.initial_state.copy()
+                current_cost = current_state.evaluate()
+                evaluations, copies, restarts = evaluations + 1, copies + 1, restarts + 1
+                path = []
+                temperature = self.initial_temp * 0.7
+                continue
+            
+            # Choose a random move
+            move = self.rng.choice(possible_moves)
+            new_state = current_state.apply_move(move[0], move[1])
+            new_cost = new_state.evaluate()
+            evaluations += 1
+            proposed += 1
+            
+            # Calculate acceptance probability
+            if new_cost < current_cost:
+                # Better solution, accept it
+                current_state = new_state
+                current_cost = new_cost
+                path.append(move)
+                accepted += 1
+                
+                if new_cost < best_cost:
+                    best_state = new_state.copy()
+                    best_cost = new_cost
+                    copies += 1
+            else:
+                # Worse solution, accept with probability
+                if temperature > 0:
+                    probability = math.exp(-(new_cost - current_cost) / temperature)
+                    if self.rng.random() < probability:
+                        current_state = new_state
+                        current_cost = new_cost
+                        path.append(move)
+                        accepted += 1
+                        worse_accepted += 1
+            if len(path) > longest_path:
+                longest_path = len(path)
+            
+            # Cool down
+            temperature *= self.cooling_rate
+            
+            # Print progress occasionally
+            if iteration % 500 == 0:
+                if self.metrics is not None:
+                    record_metrics()
+                self.report_progress(iteration, current_cost, self.best_move_count if self.best_solution else None)
+                best_so_far = f", Best: {self.best_move_count} moves" if self.best_solution else ""
+                self._log(f"Iteration {iteration}, Cost: {current_cost:.2f}, Moves: {len(path)}, Temp: {temperature:.2f}{best_so_far}")
+        
+        if self.metrics is not None:
+            record_metrics()
+            self.metrics.add_time('search', time.perf_counter() - search_start)
+        self.report_finished(self.best_solution)
+        
+        if self.best_solution:
+            self._log(f"Solver finished. Best solution: {self.best_move_count} moves")
+            return self.best_solution
+        else:
+            self._log(f"Solver finished. No solution found.")
+            return None
+
+# Shared state for portfolio worker processes, set by _init_portfolio_worker
+_portfolio_best = None
+_portfolio_cancel = None
+
+def _init_portfolio_worker(shared_best, cancel_event):
+    global _portfolio_best, _portfolio_cancel
+    _portfolio_best = shared_best
+    _portfolio_cancel = cancel_event
+
+def _run_annealing_chain(initial_state, seed, initial_temp, cooling_rate, max_moves, max_iterations):
+    """Run one annealing chain inside a portfolio worker process"""
+    solver = SimulatedAnnealingSolver(initial_state, max_iterations, initial_temp, cooling_rate, max_moves,
+                                      seed=seed, shared_best=_portfolio_best, cancel_event=_portfolio_cancel,
+                                      verbose=False)
+    path = solver.solve()
+    return seed, path, solver.iterations
+
+class ParallelAnnealingPortfolio(SolverBase):
+    """Runs independent annealing chains in a process pool and keeps the shortest solution"""
+    # (initial_temp, cooling_rate, max_moves) schedules handed out to the chains in turn
+    SCHEDULES = [
+        (1000, 0.995, 50),
+        (500, 0.99, 50),
+        (2000, 0.998, 100),
+        (250, 0.98, 80),
+        (1000, 0.999, 150),
+        (4000, 0.995, 200),
+    ]
+    
+    def __init__(self, initial_state, workers=None, chains=None, max_iterations=5000, seed=None, first_wins=False):
+        self.initial_state = CompactState.from_state(initial_state)
+        self.workers = workers or os.cpu_count() or 1
+        self.chains = chains or self.workers
+        self.max_iterations = max_iterations
+        self.seed = seed
+        self.first_wins = first_wins  # Stop at the first solution instead of waiting for every chain
+        self.best_solution = None
+        self.best_move_count = float('inf')
+    
+    def chain_settings(self):
+        """Seed and temperature schedule for every chain"""
+        rng = random.Random(self.seed)
+        settings = []
+        for chain in range(self.chains):
+            initial_temp, cooling_rate, max_moves = self.SCHEDULES[chain % len(self.SCHEDULES)]
+            settings.append((rng.getrandbits(32), initial_temp, cooling_rate, max_moves))
+        return settings
+    
+    def solve(self, deadline=None):
+        """Solve with every chain in parallel; same return contract as SimulatedAnnealingSolver.solve()"""
+        self.deadline = deadline
+        print(f"Starting annealing portfolio: {self.chains} chains on {self.workers} processes...")
+        start = time.time()
+        shared_best = multiprocessing.Value('i', 2 ** 31 - 1)
+        cancel_event = multiprocessing.Event()
+        
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_portfolio_worker,
+                                       initargs=(shared_best, cancel_event))
+        try:
+            futures = [executor.submit(_run_annealing_chain, self.initial_state, seed, initial_temp,
+                                       cooling_rate, max_moves, self.max_iterations)
+                       for seed, initial_temp, cooling_rate, max_moves in self.chain_settings()]
+            pending = set(futures)
+            finished = 0
+            while pending and not self.cancelled():
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished += 1
+                    seed, path, iterations = future.result()
+                    self.iterations += iterations
+                    if path is not None and len(path) < self.best_move_count:
+                        self.best_solution = path
+                        self.best_move_count = len(path)
+                        self.report_solution(path)
+                        print(f"Chain {seed:08x} found a {len(path)}-move solution")
+                best_length = self.best_move_count if self.best_solution else None
+                self.report_progress(finished, shared_best.value if best_length else None, best_length)
+                if self.first_wins and self.best_solution:
+                    break
+        finally:
+            # Tell running chains to stop and drop the ones that never started
+            cancel_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+        
+        elapsed = time.time() - start
+        if self.metrics is not None:
+            self.metrics.update(chains_finished=finished)
+        self.report_finished(self.best_solution)
+        if self.best_solution:
+            print(f"Portfolio finished. Best solution: {self.best_move_count} moves ({elapsed:.2f}s)")
+            return self.best_solution
+        print(f"Portfolio finished. No solution found ({elapsed:.2f}s)")
+        return None
+
+class AStarSolver(SolverBase):
+    """Exact solver - A* or IDA* over GameState with a transposition table.
+    
+    With table_bytes, IDA* uses a TranspositionTable of that size instead
+    of a dict, optionally spilling to a file in the table_spill directory.
+    IDA* only uses the table to skip repeated work, so any budget is safe.
+    A* keeps every parent of the path it returns and its whole frontier,
+    so it cannot take a bounded table.
+    """
+    def __init__(self, initial_state, optimize='moves', algorithm='astar', max_nodes=500000,
+                 table_bytes=None, table_spill=None, table_policy='depth'):
+        if optimize not in ('moves', 'pushes'):
+            raise ValueError(f"optimize must be 'moves' or 'pushes', not {optimize!r}")
+        if algorithm not in ('astar', 'idastar'):
+            raise ValueError(f"algorithm must be 'astar' or 'idastar', not {algorithm!r}")
+        if table_bytes and algorithm == 'astar':
+            raise ValueError("A bounded transposition table needs algorithm='idastar'")
+        self.initial_state = CompactState.from_state(initial_state)
+        self.optimize = optimize
+        self.algorithm = algorithm
+        self.max_nodes = max_nodes  # None searches until the state space is exhausted
+        self.table_bytes = table_bytes
+        self.table_spill = table_spill
+        self.table_policy = table_policy
+        self.table = None  # The bounded table, once created
+        self.nodes_expanded = 0
+        self.best_solution = None
+        self.best_move_count = float('inf')
+        self.best_push_count = float('inf')
+    
+    def _new_table(self):
+        """Empty transposition table; the bounded one is created once and emptied by aging"""
+        if not self.table_bytes:
+            return {}
+        if self.table is None:
+            self.table = TranspositionTable(self.table_bytes, self.table_spill, policy=self.table_policy)
+        else:
+            self.table.new_generation()
+        return self.table
+    
+    def heuristic(self, state):
+        """Admissible lower bound as (pushes, moves)"""
+        board = state.board
+        if not state.crates or not board.targets:
+            return 0, 0
+        
+        # Each crate matched to a distinct target needs at least its push distance
+        pushes = state.push_lower_bound(cache=False)
+        
+        # The player also has to walk up to a crate before the next push
+        walk = 0
+        if pushes:
+            px, py = board.position(state.player)
+            walk = min(abs(px - x) + abs(py - y) for x, y in map(board.position, iter_cells(state.crates))) - 1
+        return pushes, pushes + walk
+    
+    def _cost(self, pushes, moves):
+        return (pushes, moves) if self.optimize == 'pushes' else (moves, pushes)
+    
+    def _f(self, state, pushes, moves):
+        h_pushes, h_moves = self.heuristic(state)
+        return self._cost(pushes + h_pushes, moves + h_moves)
+    
+    @property
+    def iterations(self):
+        return self.nodes_expanded
+    
+    def _out_of_budget(self):
+        if self.max_nodes is not None and self.nodes_expanded >= self.max_nodes:
+            return True
+        return self.nodes_expanded % 1000 == 0 and self.cancelled()
+    
+    def solve(self, deadline=None):
+        """Return the optimal list of (dx, dy) moves, or None if none was found within max_nodes or by the deadline"""
+        self.deadline = deadline
+        print(f"Starting {self.algorithm} solver ({self.optimize}-optimal)...")
+        start = time.time()
+        if self.initial_state.is_hopeless():
+            print("Some targets can never be filled")
+            path = None
+        else:
+            try:
+                with self.phase('search'):
+                    path = self._solve_astar() if self.algorithm == 'astar' else self._solve_idastar()
+            finally:
+                if self.table is not None:
+                    if self.metrics is not None:
+                        self.metrics.update(**self.table.stats())
+                    self.table.close()
+        elapsed = time.time() - start
+        self.report_finished(path)
+        
+        if path is None:
+            print(f"Solver finished. No solution found after {self.nodes_expanded} nodes ({elapsed:.2f}s)")
+            return None
+        
+        self.best_solution = path
+        self.best_move_count = len(path)
+        self.report_solution(path)
+        print(f"Solver finished. {self.optimize.capitalize()}-optimal solution: {self.best_move_count} moves, "
+              f"{self.best_push_count} pushes ({self.nodes_expanded} nodes, {elapsed:.2f}s)")
+        return path
+    
+    def _solve_astar(self):
+        root = self.initial_state
+        root_hash = root.zkey
+        
+        # Transposition table: hash -> (best g, parent hash, move)
+        table = {root_hash: (self._cost(0, 0), None, None)}
+        counter = 0
+        frontier = [(self._f(root, 0, 0), counter, root_hash, 0, 0, root)]
+        
+        while frontier:
+            f, _, h, pushes, moves, state = heapq.heappop(frontier)
+            if table[h][0] != self._cost(pushes, moves):
+                continue  # Stale entry, a cheaper path to this state was found later
+            
+            if state.is_solved():
+                self.best_push_count = pushes
+                self.record_search(len(table), len(frontier), counter)
+                return self._rebuild_path(table, h)
+            
+            if self._out_of_budget():
+                self.record_search(len(table), len(frontier), counter)
+                return None
+            self.nodes_expanded += 1
+            if self.nodes_expanded % 2000 == 0:
+                self.record_search(len(table), len(frontier), counter)
+                self.report_progress(self.nodes_expanded, f[0])
+            
+            for move, child, pushed in state.successors():
+                child_hash = child.zkey
+                child_pushes = pushes + 1 if pushed else pushes
+                child_moves = moves + 1
+                child_cost = self._cost(child_pushes, child_moves)
+                known = table.get(child_hash)
+                if known is not None and known[0] <= child_cost:
+                    continue
+                
+                table[child_hash] = (child_cost, h, move)
+                counter += 1
+                heapq.heappush(frontier, (self._f(child, child_pushes, child_moves),
+                                          counter, child_hash, child_pushes, child_moves, child))
+        self.record_search(len(table), 0, counter)
+        return None
+    
+    def _rebuild_path(self, table, h):
+        path = []
+        while True:
+            _, parent, move = table[h]
+            if parent is None:
+                break
+            path.append(move)
+            h = parent
+        path.reverse()
+        return path
+    
+    def _solve_idastar(self):
+        root = self.initial_state
+        root_hash = root.zkey
+        threshold = self._f(root, 0, 0)[0]
+        path = []
+        
+        while True:
+            # Transposition table for this iteration: hash -> (cheapest g reached, None, None)
+            table = self._new_table()
+            result = self._idastar_search(root, root_hash, 0, 0, threshold, path, table)
+            if result is True:
+                return path
+            if result is None:
+                return None  # Exhausted the state space or the node budget
+            threshold = result
+    
+    def _idastar_search(self, state, h, pushes, moves, threshold, path, table):
+        """Depth-first search bounded by threshold; returns True, the next threshold, or None"""
+        # Only the primary cost is bounded, the secondary one just orders equal solutions
+        f = self._f(state, pushes, moves)[0]
+        if f > threshold:
+            return f
+        if state.is_solved():
+            self.best_push_count = pushes
+            return True
+        
+        g = self._cost(pushes, moves)
+        known = table.get(h)
+        if known is not None and known[0] <= g:
+            return None
+        table[h] = (g, None, None)
+        
+        if self._out_of_budget():
+            return None
+        self.nodes_expanded += 1
+        if self.nodes_expanded % 2000 == 0:
+            self.record_search(len(table), len(path))
+            self.report_progress(self.nodes_expanded, threshold)
+        
+        next_threshold = None
+        for move, child, pushed in state.successors():
+            path.append(move)
+            result = self._idastar_search(child, child.zkey, pushes + 1 if pushed else pushes,
+                                          moves + 1, threshold, path, table)
+            if result is True:
+                return True
+            path.pop()
+            if result is not None and (next_threshold is None or result < next_threshold):
+                next_threshold = result
+        return next_threshold
+
+class PushSearchSolver(SolverBase):
+    """A* over crate configurations, walking paths are filled in afterwards.
+    
+    By default the solution is push-optimal. Tunnel and goal-room macros and
+    a heuristic weight above 1 trade a few extra pushes for a far smaller
+    search, which is what makes large levels tractable.
+    """
+    def __init__(self, initial_state, max_nodes=500000, macros=False, weight=1, goal_keys=None):
+        self.initial_state = CompactState.from_state(initial_state)
+        self.max_nodes = max_nodes  # None searches until the state space is exhausted
+        self.macros = macros
+        self.weight = weight
+        self.goal_keys = goal_keys  # Normalized keys known to lead to a solution; reaching one ends the search too
+        self.nodes_expanded = 0
+        self.best_solution = None
+        self.best_move_count = float('inf')
+        self.best_push_count = float('inf')
+    
+    def solve(self, deadline=None):
+        """Return a push-optimal list of (dx, dy) moves, or None if none was found in budget"""
+        self.deadline = deadline
+        print("Starting push-level A* solver...")
+        start = time.time()
+        with self.phase('search'):
+            pushes = self._search()
+        elapsed = time.time() - start
+        
+        if pushes is None:
+            self.report_finished(None)
+            print(f"Solver finished. No solution found after {self.nodes_expanded} nodes ({elapsed:.2f}s)")
+            return None
+        
+        with self.phase('expand_moves'):
+            self.best_solution = self.initial_state.pushes_to_moves(pushes)
+        self.best_move_count = len(self.best_solution)
+        self.best_push_count = len(pushes)
+        self.report_solution(self.best_solution)
+        self.report_finished(self.best_solution)
+        kind = "Solution" if self.macros or self.weight != 1 else "Push-optimal solution"
+        print(f"Solver finished. {kind}: {self.best_move_count} moves, "
+              f"{self.best_push_count} pushes ({self.nodes_expanded} nodes, {elapsed:.2f}s)")
+        return self.best_solution
+    
+    @property
+    def iterations(self):
+        return self.nodes_expanded
+    
+    def _search(self):
+        # Nodes are keyed by crates plus the player's region, so every state
+        # reachable from each other by walking alone collapses into one node.
+        # closed: normalized key -> (parent key, list of pushes leading here)
+        root = self.initial_state
+        unreachable = root.board.unreachable
+        if root.is_hopeless():
+            print("Some targets can never be filled")
+            return None
+        closed = {}
+        counter = 0
+        frontier = [((root.push_lower_bound(), 0), counter, 0, root, None, [])]
+        
+        while frontier:
+            f, _, pushes, state, parent_key, push_list = heapq.heappop(frontier)
+            distance, lowest = state.reachable()
+            key = state.normalized_key(lowest)
+            if key in closed:
+                continue
+            closed[key] = (parent_key, push_list)
+            
+            if state.is_solved() or (self.goal_keys is not None and key in self.goal_keys):
+                self.record_search(len(closed), len(frontier), counter)
+                return self._rebuild_pushes(closed, key)
+            
+            if self.max_nodes is not None and self.nodes_expanded >= self.max_nodes:
+                self.record_search(len(closed), len(frontier), counter)
+                return None
+            if self.nodes_expanded % 1000 == 0 and self.cancelled():
+                self.record_search(len(closed), len(frontier), counter)
+                return None
+            self.nodes_expanded += 1
+            if self.nodes_expanded % 500 == 0:
+                self.record_search(len(closed), len(frontier), counter)
+                self.report_progress(self.nodes_expanded, f[0])
+            
+            if self.macros:
+                successors = state.macro_push_successors(distance)
+            else:
+                successors = (([(cell, direction)], child)
+                              for cell, direction, child in state.push_successors(distance))
+            for push_list, child in successors:
+                bound = child.push_lower_bound(cache=False)
+                if bound >= unreachable:
+                    continue
+                counter += 1
+                g = pushes + len(push_list)
+                heapq.heappush(frontier, ((g + self.weight * bound, child.move_count), counter, g, child, key, push_list))
+        self.record_search(len(closed), 0, counter)
+        return None
+    
+    def _rebuild_pushes(self, closed, key):
+        pushes = []
+        while True:
+            parent_key, push_list = closed[key]
+            if parent_key is None:
+                break
+            pushes.extend(reversed(push_list))
+            key = parent_key
+        pushes.reverse()
+        return pushes
+
+class BidirectionalSolver(SolverBase):
+    """Push search from the start meeting a pull search from the solved position.
+    
+    Both searches work on crate configurations with the player's region, like
+    PushSearchSolver, and share one table of visited nodes; the first node
+    reached from both sides joins the two halves. The pull side starts from
+    every region the player could finish in, and only pulls crates onto cells
+    some starting crate can be pushed to. It needs exactly one crate per
+    target; otherwise only the forward half runs.
+    """
+    def __init__(self, initial_state, max_nodes=500000):
+        self.initial_state = CompactState.from_state(initial_state)
+        self.max_nodes = max_nodes  # Nodes expanded by both sides together
+        self.nodes_expanded = 0
+        self.best_solution = None
+        self.best_move_count = float('inf')
+        self.best_push_count = float('inf')
+    
+    def solve(self, deadline=None):
+        """Return a list of (dx, dy) moves, or None if the searches did not meet within max_nodes or by the deadline"""
+        self.deadline = deadline
+        print("Starting bidirectional push/pull solver...")
+        start = time.time()
+        with self.phase('search'):
+            pushes = self._search()
+        elapsed = time.time() - start
+        
+        if pushes is None:
+            self.report_finished(None)
+            print(f"Solver finished. No solution found after {self.nodes_expanded} nodes ({elapsed:.2f}s)")
+            return None
+        
+        with self.phase('expand_moves'):
+            self.best_solution = self.initial_state.pushes_to_moves(pushes)
+        self.best_move_count = len(self.best_solution)
+        self.best_push_count = len(pushes)
+        self.report_solution(self.best_solution)
+        self.report_finished(self.best_solution)
+        print(f"Solver finished. Solution: {self.best_move_count} moves, "
+              f"{self.best_push_count} pushes ({self.nodes_expanded} nodes, {elapsed:.2f}s)")
+        return self.best_solution
+    
+    @property
+    def iterations(self):
+        return self.nodes_expanded
+    
+    def _origin_distances(self):
+        """Fewest pushes taking any starting crate, moved alone, to each cell"""
+        board = self.initial_state.board
+        walls = board.walls
+        distance = [board.unreachable] * board.size
+        queue = deque()
+        for cell in iter_cells(self.initial_state.crates):
+            distance[cell] = 0
+            queue.append(cell)
+        while queue:
+            cell = queue.popleft()
+            for offset in board.offsets:
+                beyond = cell + offset
+                if distance[beyond] == board.unreachable and not walls[beyond] and not walls[cell - offset]:
+                    distance[beyond] = distance[cell] + 1
+                    queue.append(beyond)
+        return distance
+    
+    def _goal_states(self):
+        """One solved state per floor region a player could finish the level in"""
+        board = self.initial_state.board
+        crates = board.target_mask
+        blocked = 0
+        states = []
+        for cell in range(board.size):
+            if board.walls[cell] or (crates >> cell) & 1 or (blocked >> cell) & 1:
+                continue
+            state = CompactState(board, cell, crates)
+            distance, _ = state.reachable()
+            for reached, steps in enumerate(distance):
+                if steps >= 0:
+                    blocked |= 1 << reached
+            states.append(state)
+        return states
+    
+    def _search(self):
+        # closed[side]: normalized key -> (parent key, pushes) with the pushes
+        # in forward order; for the pull side they lead from the node to its parent
+        root = self.initial_state
+        board = root.board
+        if root.is_solved():
+            return []
+        if root.is_hopeless():
+            print("Some targets can never be filled")
+            return None
+        
+        origin = self._origin_distances()
+        allowed = bytes(distance < board.unreachable for distance in origin)
+        closed = ({}, {})
+        frontiers = ([(root.push_lower_bound(), 0, 0, root, None, [])], [])
+        counter = 0
+        if board.crate_count == len(board.targets):
+            for state in self._goal_states():
+                counter += 1
+                frontiers[1].append((sum(origin[cell] for cell in iter_cells(state.crates)), counter, 0, state, None, []))
+            heapq.heapify(frontiers[1])
+        
+        while frontiers[0] or frontiers[1]:
+            # Grow whichever side has the smaller frontier
+            side = 0 if not frontiers[1] or (frontiers[0] and len(frontiers[0]) <= len(frontiers[1])) else 1
+            f, _, pushes, state, parent_key, push_list = heapq.heappop(frontiers[side])
+            distance, lowest = state.reachable()
+            key = state.normalized_key(lowest)
+            if key in closed[side]:
+                continue
+            closed[side][key] = (parent_key, push_list)
+            
+            if key in closed[1 - side] or (side == 0 and state.is_solved()):
+                self._record_sides(closed, frontiers, counter)
+                return self._rebuild_pushes(closed, key)
+            
+            if self.max_nodes is not None and self.nodes_expanded >= self.max_nodes:
+                self._record_sides(closed, frontiers, counter)
+                return None
+            if self.nodes_expanded % 1000 == 0 and self.cancelled():
+                self._record_sides(closed, frontiers, counter)
+                return None
+            self.nodes_expanded += 1
+            if self.nodes_expanded % 500 == 0:
+                self._record_sides(closed, frontiers, counter)
+                self.report_progress(self.nodes_expanded, f)
+            
+            if side == 0:
+                for cell, direction, child in state.push_successors(distance):
+                    bound = child.push_lower_bound(cache=False)
+                    if bound >= board.unreachable:
+                        continue
+                    counter += 1
+                    heapq.heappush(frontiers[0], (pushes + 1 + bound, counter, pushes + 1, child, key,
+                                                  [(cell, direction)]))
+            else:
+                for cell, direction, child in state.pull_successors(distance, allowed):
+                    # Undone by pushing the crate from its new cell back the other way
+                    pulled = cell + board.offsets[direction]
+                    estimate = sum(origin[crate] for crate in iter_cells(child.crates))
+                    counter += 1
+                    heapq.heappush(frontiers[1], (pushes + 1 + estimate, counter, pushes + 1, child, key,
+                                                  [(pulled, (direction + 2) % 4)]))
+        self._record_sides(closed, frontiers, counter)
+        return None
+    
+    def _record_sides(self, closed, frontiers, generated):
+        self.record_search(len(closed[0]) + len(closed[1]), len(frontiers[0]) + len(frontiers[1]), generated)
+        if self.metrics is not None:
+            self.metrics.update(forward_nodes=len(closed[0]), backward_nodes=len(closed[1]))
+    
+    def _rebuild_pushes(self, closed, key):
+        """Pushes from the start to key, then from key on to the solved position"""
+        forward, backward = closed
+        pushes = []
+        node = key
+        while node in forward:
+            parent_key, push_list = forward[node]
+            if parent_key is None:
+                break
+            pushes.extend(reversed(push_list))
+            node = parent_key
+        pushes.reverse()
+        node = key
+        while node in backward:
+            parent_key, push_list = backward[node]
+            if parent_key is None:
+                break
+            pushes.extend(push_list)
+            node = parent_key
+        return pushes
+
+class BatchRules:
+    """The move rules applied to a whole frontier at once with NumPy.
+    
+    A frontier is a pair of arrays: player cells (N) and crate occupancy
+    (N x board.size booleans). Every method works on all N states in a
+    handful of vectorised operations instead of a Python loop per state.
+    """
+    def __init__(self, board):
+        if np is None:
+            raise RuntimeError("the batch engines need NumPy (pip install numpy)")
+        self.board = board
+        self.walls = np.frombuffer(board.walls, dtype=np.uint8).astype(bool)
+        # Dead squares only prune when every crate is needed on a target
+        self.dead = np.zeros(board.size, dtype=bool)
+        if not board.spare_crates:
+            self.dead = np.frombuffer(bytes(board.dead_squares), dtype=np.uint8).astype(bool)
+        self.targets = np.zeros(board.size, dtype=bool)
+        self.targets[board.targets] = True
+        self.distance = np.array(board.target_distance, dtype=np.int64)
+    
+    def from_states(self, states):
+        players = np.array([state.player for state in states], dtype=np.int64)
+        crates = np.zeros((len(states), self.board.size), dtype=bool)
+        for row, state in enumerate(states):
+            crates[row, list(iter_cells(state.crates))] = True
+        return players, crates
+    
+    def successors(self, players, crates):
+        """All legal moves of every state: (parent row, direction, pushed, new players, new crates)"""
+        rows = np.arange(len(players))
+        size = self.board.size
+        parents, directions, pushes, new_players, new_crates = [], [], [], [], []
+        for direction, offset in enumerate(self.board.offsets):
+            step = players + offset
+            beyond = np.clip(step + offset, 0, size - 1)
+            crate_ahead = crates[rows, step]
+            blocked = self.walls[beyond] | crates[rows, beyond] | self.dead[beyond]
+            legal = np.nonzero(~self.walls[step] & ~(crate_ahead & blocked))[0]
+            
+            pushed = crate_ahead[legal]
+            moved = crates[legal]
+            pushed_rows = np.nonzero(pushed)[0]
+            moved[pushed_rows, step[legal[pushed_rows]]] = False
+            moved[pushed_rows, beyond[legal[pushed_rows]]] = True
+            
+            parents.append(legal)
+            directions.append(np.full(len(legal), direction, dtype=np.int8))
+            pushes.append(pushed)
+            new_players.append(step[legal])
+            new_crates.append(moved)
+        return (np.concatenate(parents), np.concatenate(directions), np.concatenate(pushes),
+                np.concatenate(new_players), np.concatenate(new_crates))
+    
+    def heuristic(self, crates):
+        """Sum of each crate's push distance to its nearest target"""
+        return crates @ self.distance
+    
+    def solved(self, crates):
+        return (crates & self.targets).sum(axis=1) >= self.board.goal_count
+    
+    def hashes(self, players, crates):
+        """64-bit hash of every state, mixing the packed crate bitmap a word at a time"""
+        packed = np.packbits(crates, axis=1)
+        padding = -packed.shape[1] % 8
+        if padding:
+            packed = np.pad(packed, ((0, 0), (0, padding)))
+        words = packed.view(np.uint64)
+        h = players.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        for column in range(words.shape[1]):
+            h = (h ^ words[:, column]) * np.uint64(0x100000001B3)
+            h ^= h >> np.uint64(29)
+        return h
+
+class BatchSearchSolver(SolverBase):
+    """Breadth-first or beam search over single moves, expanding whole layers with BatchRules.
+    
+    Without a beam width every layer is kept, so the first solution found
+    has the fewest moves; with one, only the beam_width states closest to
+    the targets survive each layer.
+    """
+    def __init__(self, initial_state, beam_width=None, max_depth=1000, max_states=2000000):
+        self.initial_state = CompactState.from_state(initial_state)
+        self.rules = BatchRules(self.initial_state.board)
+        self.beam_width = beam_width
+        self.max_depth = max_depth
+        self.max_states = max_states
+        self.iterations = 0
+        self.best_solution = None
+        self.best_move_count = float('inf')
+    
+    def solve(self, deadline=None):
+        """Return a list of (dx, dy) moves, or None"""
+        self.deadline = deadline
+        kind = f"beam search (width {self.beam_width})" if self.beam_width else "breadth-first search"
+        print(f"Starting batch {kind}...")
+        start = time.time()
+        with self.phase('search'):
+            path = self._search()
+        elapsed = time.time() - start
+        self.report_finished(path)
+        
+        if path is None:
+            print(f"Solver finished. No solution found after {self.iterations} states ({elapsed:.2f}s)")
+            return None
+        self.best_solution = path
+        self.best_move_count = len(path)
+        self.report_solution(path)
+        print(f"Solver finished. Solution: {len(path)} moves ({self.iterations} states, {elapsed:.2f}s)")
+        return path
+    
+    def _search(self):
+        rules = self.rules
+        players, crates = rules.from_states([self.initial_state])
+        if rules.solved(crates)[0]:
+            return []
+        seen = rules.hashes(players, crates)  # Sorted hashes of every state reached so far
+        layers = []  # (parent row, direction) arrays per depth, for rebuilding the path
+        generated = 0
+        
+        for depth in range(self.max_depth):
+            if self.cancelled() or not len(players):
+                return None
+            self.iterations += len(players)
+            layer_start = time.perf_counter()
+            parents, directions, _, players, crates = rules.successors(players, crates)
+            generated += len(players)
+            expanded = time.perf_counter()
+            
+            # Drop repeats inside the layer, then states seen in earlier layers
+            hashes, first = np.unique(rules.hashes(players, crates), return_index=True)
+            new = ~np.isin(hashes, seen, assume_unique=True)
+            seen = np.union1d(seen, hashes[new])
+            fresh = np.sort(first[new])
+            if self.metrics is not None:
+                self.metrics.add_time('expand', expanded - layer_start)
+                self.metrics.add_time('deduplicate', time.perf_counter() - expanded)
+            parents, directions, players, crates = parents[fresh], directions[fresh], players[fresh], crates[fresh]
+            
+            if self.beam_width and len(players) > self.beam_width:
+                best = np.argpartition(rules.heuristic(crates), self.beam_width)[:self.beam_width]
+                parents, directions, players, crates = parents[best], directions[best], players[best], crates[best]
+            layers.append((parents, directions))
+            
+            self.record_search(len(seen), len(players), generated)
+            done = np.nonzero(rules.solved(crates))[0]
+            if len(done):
+                return self._rebuild_path(layers, int(done[0]))
+            if len(seen) > self.max_states:
+                return None
+            self.report_progress(self.iterations, int(rules.heuristic(crates).min()) if len(crates) else None)
+        return None
+    
+    def _rebuild_path(self, layers, row):
+        path = []
+        for parents, directions in reversed(layers):
+            path.append(DIRECTIONS[directions[row]])
+            row = parents[row]
+        path.reverse()
+        return path
+
+SOLVER_ENGINES = ['astar-moves', 'astar-pushes', 'idastar-moves', 'idastar-pushes', 'push-astar', 'push-macro',
+                  'push-bidir', 'anneal', 'anneal-portfolio']
+if np is not None:
+    SOLVER_ENGINES += ['batch-bfs', 'batch-beam']
+
+def create_solver(engine, state, **options):
+    """Build the solver for one of SOLVER_ENGINES; options go to the solver's constructor"""
+    if engine == 'astar-moves':
+        return AStarSolver(state, optimize='moves', **options)
+    if engine == 'astar-pushes':
+        return AStarSolver(state, optimize='pushes', **options)
+    if engine == 'idastar-moves':
+        return AStarSolver(state, optimize='moves', algorithm='idastar', **options)
+    if engine == 'idastar-pushes':
+        return AStarSolver(state, optimize='pushes', algorithm='idastar', **options)
+    if engine == 'push-astar':
+        return PushSearchSolver(state, **options)
+    if engine == 'push-macro':
+        return PushSearchSolver(state, **{'macros': True, 'weight': 2, **options})
+    if engine == 'push-bidir':
+        return BidirectionalSolver(state, **options)
+    if engine == 'anneal':
+        return SimulatedAnnealingSolver(state, **options)
+    if engine == 'anneal-portfolio':
+        return ParallelAnnealingPortfolio(state, **options)
+    if engine == 'batch-bfs':
+        return BatchSearchSolver(state, **options)
+    if engine == 'batch-beam':
+        return BatchSearchSolver(state, **{'beam_width': 2000, **options})
+    raise ValueError(f"Unknown solver engine: {engine}")
+
+def _solution_pushes(state, moves):
+    """The pushes a move list makes, as (crate cell, direction index), up to the point it solves the level.
+    
+    A push sequence that returns to an earlier crate layout with the player
+    in the same region is a detour and is cut out. Returns None if a move
+    walks into a wall or a blocked crate.
+    """
+    board = state.board
+    index = {state.normalized_key(state.reachable()[1]): 0}
+    pushes = []
+    for dx, dy in moves:
+        if state.is_solved():
+            break
+        direction = DIRECTIONS.index((dx, dy))
+        step = state.player + board.offsets[direction]
+        beyond = step + board.offsets[direction]
+        if board.walls[step] or ((state.crates >> step) & 1 and (board.walls[beyond] or (state.crates >> beyond) & 1)):
+            return None
+        pushed = (state.crates >> step) & 1
+        state = state.apply_move(dx, dy)
+        if not pushed:
+            continue
+        pushes.append((step, direction))
+        key = state.normalized_key(state.reachable()[1])
+        if key in index:
+            del pushes[index[key]:]
+            index = {k: i for k, i in index.items() if i <= len(pushes)}
+        else:
+            index[key] = len(pushes)
+    return pushes
+
+def _push_state(state, push):
+    """State after a push, or None if the player cannot walk to it or the crate cannot move"""
+    board = state.board
+    cell, direction = push
+    offset = board.offsets[direction]
+    beyond = cell + offset
+    if not (state.crates >> cell) & 1 or board.walls[beyond] or (state.crates >> beyond) & 1:
+        return None
+    distance, _ = state.reachable()
+    walk = distance[cell - offset]
+    if walk < 0:
+        return None
+    keys = board.zobrist
+    zkey = (state.zkey ^ keys.player_keys[state.player] ^ keys.player_keys[cell]
+            ^ keys.crate_keys[cell] ^ keys.crate_keys[beyond])
+    return CompactState(board, cell, state.crates ^ (1 << cell) ^ (1 << beyond), state.move_count + walk + 1, zkey)
+
+def optimize_solution(state, moves, max_passes=3):
+    """Shorten a solution without changing what it pushes where.
+    
+    Detours that come back to an earlier position are dropped, the walk
+    before every push is replaced by a shortest path, and neighbouring
+    pushes of different crates are swapped whenever that saves walking.
+    Returns the new move list, never longer than moves.
+    """
+    start = CompactState.from_state(state)
+    pushes = _solution_pushes(start, moves)
+    if pushes is None:
+        return list(moves)
+    
+    # states[i] is the position before pushes[i]; move_count counts the walking and pushing so far
+    states = [CompactState(start.board, start.player, start.crates, 0, start.zkey)]
+    for push in pushes:
+        states.append(_push_state(states[-1], push))
+    if not states[-1].is_solved():
+        return list(moves)
+    
+    for _ in range(max_passes):
+        improved = False
+        for i in range(len(pushes) - 1):
+            first, second = pushes[i], pushes[i + 1]
+            cells = {first[0], first[0] + start.board.offsets[first[1]]}
+            if cells & {second[0], second[0] + start.board.offsets[second[1]]}:
+                continue  # Same crate, or the pushes get in each other's way
+            middle = _push_state(states[i], second)
+            after = middle and _push_state(middle, first)
+            if after is None:
+                continue
+            end = i + 3 if i + 2 < len(pushes) else i + 2
+            following = after if end == i + 2 else _push_state(after, pushes[i + 2])
+            if following is None or following.move_count >= states[end].move_count:
+                continue
+            pushes[i], pushes[i + 1] = second, first
+            states[i + 1], states[i + 2] = middle, after
+            # Walks after the swapped pair are unchanged, only the running totals shift
+            saved = states[end].move_count - following.move_count
+            if end == i + 3:
+                states[end] = following
+            for j in range(end + 1, len(states)):
+                previous = states[j]
+                states[j] = CompactState(previous.board, previous.player, previous.crates,
+                                         previous.move_count - saved, previous.zkey)
+            improved = True
+        if not improved:
+            break
+    
+    optimized = start.pushes_to_moves(pushes)
+    return optimized if len(optimized) < len(moves) else list(moves)
+
+class HintEngine:
+    """Next-push hints from any position, cheap enough to ask for after every move.
+    
+    Every position along a planned solution is remembered by its crates and
+    the player's region, so walking around or following the plan costs one
+    flood fill. A push off the plan starts a small search for the way back
+    to any remembered position, and only that stretch is planned anew; a
+    full search runs only when the player has strayed too far from it.
+    """
+    def __init__(self, repair_nodes=2000, max_nodes=50000, max_positions=200000):
+        self.repair_nodes = repair_nodes
+        self.max_nodes = max_nodes
+        self.max_positions = max_positions
+        self.board = None
+        self.plan = {}         # normalized key -> (crate cell, direction index) of the next planned push
+        self.failed = set()    # Keys no search found a way on from, so they are not searched again
+        self.stats = {'hits': 0, 'repairs': 0, 'replans': 0, 'failures': 0}
+    
+    def add_solution(self, state, moves):
+        """Adopt a solution found elsewhere, e.g. by auto-solve, as part of the plan"""
+        state = self._prepare(state)
+        pushes = _solution_pushes(state, moves)
+        if pushes:
+            self._remember(state, pushes)
+    
+    def needs_search(self, state):
+        """Whether hint() would have to search: the position is off every plan and not known to be lost"""
+        state = self._prepare(state)
+        if state.is_solved():
+            return False
+        key = state.normalized_key(state.reachable()[1])
+        return key not in self.plan and key not in self.failed
+    
+    def hint(self, state, deadline=None, cancel_event=None):
+        """The next push as ((x, y) of the crate, (dx, dy)), or None if solved or no plan was found"""
+        state = self._prepare(state)
+        if state.is_solved():
+            return None
+        key = state.normalized_key(state.reachable()[1])
+        push = self.plan.get(key)
+        if push is not None:
+            self.stats['hits'] += 1
+        elif key not in self.failed:
+            push = self._replan(state, key, deadline, cancel_event)
+        if push is None:
+            return None
+        cell, direction = push
+        return self.board.position(cell), DIRECTIONS[direction]
+    
+    def walk(self, state, hint):
+        """The moves that carry out a hint: a shortest walk to the crate followed by the push"""
+        state = CompactState.from_state(state)
+        (x, y), (dx, dy) = hint
+        board = state.board
+        moves = state.walk_to(board.index(x - dx, y - dy))
+        return None if moves is None else moves + [(dx, dy)]
+    
+    def _prepare(self, state):
+        state = CompactState.from_state(state)
+        if state.board is not self.board:
+            self.board = state.board
+            self.plan = {}
+            self.failed = set()
+        return state
+    
+    def _replan(self, state, key, deadline, cancel_event):
+        pushes = None
+        if self.plan:
+            # Any remembered position leads on to a solution, so the search may stop at the first one
+            solver = PushSearchSolver(state, self.repair_nodes, goal_keys=self.plan)
+            solver.attach(cancel_event=cancel_event)
+            solver.deadline = deadline
+            pushes = solver._search()
+            if pushes is not None:
+                self.stats['repairs'] += 1
+        if pushes is None:
+            if len(self.plan) > self.max_positions:
+                self.plan.clear()
+            solver = PushSearchSolver(state, self.max_nodes, macros=True, weight=2)
+            solver.attach(cancel_event=cancel_event)
+            solver.deadline = deadline
+            pushes = solver._search()
+            if pushes is None:
+                self.stats['failures'] += 1
+                if not solver.cancelled():
+                    self.failed.add(key)
+                return None
+            self.stats['replans'] += 1
+        self._remember(state, pushes)
+        return self.plan[key]
+    
+    def _remember(self, state, pushes):
+        for push in pushes:
+            self.plan[state.normalized_key(state.reachable()[1])] = push
+            state = _push_state(state, push)
+
+class HintSearch(SolverBase):
+    """A HintEngine replan packaged as a solver, so a SolverWorker can run it off the render thread.
+    
+    solve() leaves the hint in self.hint and returns None: it finds a push,
+    not a solution. position is the caller's key for the position searched.
+    """
+    def __init__(self, engine, initial_state, position):
+        self.engine = engine
+        self.initial_state = initial_state
+        self.position = position
+        self.hint = None
+    
+    def solve(self, deadline=None):
+        self.deadline = deadline
+        self.hint = self.engine.hint(self.initial_state, deadline, self.cancel_event)
+        return None
+
+MOVE_LETTERS = 'urdl'  # Same order as DIRECTIONS
+
+def moves_to_text(moves):
+    """Encode a list of (dx, dy) moves as a string of u/r/d/l letters"""
+    return ''.join(MOVE_LETTERS[DIRECTIONS.index(tuple(move))] for move in moves)
+
+def text_to_moves(text):
+    """Decode a LURD string back into (dx, dy) moves, ignoring case; see MoveLog.from_text()"""
+    return MoveLog.from_text(text).moves()
+
+# Packed moves: four to a byte, two bits each holding the direction index, first move in the low bits.
+# Pushes are left out since a replay from the level's start finds them again.
+_UNPACKED = [tuple(DIRECTIONS[(byte >> shift) & 3] for shift in (0, 2, 4, 6)) for byte in range(256)]
+
+def pack_moves(moves):
+    """Encode (dx, dy) moves in a quarter of a byte each; the count is needed to unpack them"""
+    directions = [DIRECTIONS.index(tuple(move)) for move in moves]
+    directions += [0] * (-len(directions) % 4)
+    return bytes(directions[i] | directions[i + 1] << 2 | directions[i + 2] << 4 | directions[i + 3] << 6
+                 for i in range(0, len(directions), 4))
+
+def unpack_moves(data, count):
+    """Decode the first count moves of pack_moves() output"""
+    if len(data) * 4 < count:
+        raise ValueError(f"{len(data)} packed bytes cannot hold {count} moves")
+    return [move for byte in data[:(count + 3) // 4] for move in _UNPACKED[byte]][:count]
+
+def verify_solution(level, moves, lurd=False, pushes=None):
+    """Replay moves from the start of a Level or GameState without pygame or any solver tables.
+    
+    Returns a dict with 'valid' (every move legal and the level solved at
+    the end), 'solved' (after the moves that could be played), the 'moves'
+    and 'pushes' made, 'error', the index of the first illegal move or
+    None, and 'reason' saying what was wrong with it. pushes, the pushed
+    flags a LURD string records in its letter case, makes a move that
+    pushes when its flag says walk, or the other way round, illegal too.
+    With lurd the played moves are added as a LURD string, pushes in upper
+    case.
+    """
+    # A padded flat grid, as in LevelBoard, so nothing needs a bounds check
+    grid = level.grid
+    width = len(grid[0]) + 2
+    walls = bytearray([1]) * (width * (len(grid) + 2))
+    for y, row in enumerate(grid):
+        for x, cell in enumerate(row):
+            if cell != WALL:
+                walls[(y + 1) * width + x + 1] = 0
+    crates = bytearray(len(walls))
+    for x, y in level.crates_pos:
+        crates[(y + 1) * width + x + 1] = 1
+    targets = bytearray(len(walls))
+    for x, y in level.targets_pos:
+        targets[(y + 1) * width + x + 1] = 1
+    needed = min(len(level.crates_pos), len(level.targets_pos))
+    on_targets = sum(1 for cell in range(len(walls)) if crates[cell] and targets[cell])
+    offsets = {(dx, dy): dy * width + dx for dx, dy in DIRECTIONS}
+    
+    player = (level.player_pos[1] + 1) * width + level.player_pos[0] + 1
+    expected = pushes
+    played = pushes = 0
+    error = reason = None
+    letters = [] if lurd else None
+    for move in moves:
+        offset = offsets.get(tuple(move))
+        if offset is None or walls[player + offset]:
+            error, reason = played, "not a move" if offset is None else "walks into a wall"
+            break
+        step = player + offset
+        pushed = crates[step]
+        if expected is not None and bool(pushed) != expected[played]:
+            error, reason = played, "pushes a crate but is written as a walk" if pushed else \
+                "is written as a push but pushes nothing"
+            break
+        if pushed:
+            beyond = step + offset
+            if walls[beyond] or crates[beyond]:
+                error, reason = played, "pushes a crate into a wall or another crate"
+                break
+            crates[step] = 0
+            crates[beyond] = 1
+            on_targets += targets[beyond] - targets[step]
+            pushes += 1
+        if letters is not None:
+            letter = MOVE_LETTERS[DIRECTIONS.index(tuple(move))]
+            letters.append(letter.upper() if pushed else letter)
+        player = step
+        played += 1
+    
+    solved = on_targets == needed
+    report = {
+        'valid': error is None and solved,
+        'solved': solved,
+        'moves': played,
+        'pushes': pushes,
+        'error': error,
+        'reason': reason,
+    }
+    if letters is not None:
+        report['lurd'] = ''.join(letters)
+    return report
+
+def format_level(grid, player_pos, crates_pos, targets_pos):
+    """Render a position back into level text, the inverse of parse_level()"""
+    rows = [[WALL if cell == WALL else FLOOR for cell in row] for row in grid]
+    targets = set(map(tuple, targets_pos))
+    crates = set(map(tuple, crates_pos))
+    for x, y in targets:
+        rows[y][x] = CRATE_ON_TARGET if (x, y) in crates else TARGET
+    for x, y in crates - targets:
+        rows[y][x] = CRATE
+    x, y = player_pos
+    rows[y][x] = PLAYER_ON_TARGET if (x, y) in targets else PLAYER
+    return '\n'.join(''.join(row).rstrip() for row in rows)
+
+class SolutionCache:
+    """Solutions keyed by level layout and position: an in-memory LRU over a size-bounded directory on disk"""
+    def __init__(self, directory=SOLUTION_CACHE_DIR, memory_entries=256, max_disk_bytes=4 * 1024 * 1024):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.disk_bytes = None  # Measured lazily on the first write
+    
+    @staticmethod
+    def key_for(state):
+        """Hash of the walls, targets, player and crates; editing a level file changes every key it had"""
+        text = format_level(state.grid, state.player_pos, state.crates_pos, state.targets_pos)
+        return hashlib.sha256(text.encode()).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".sol")
+    
+    def get(self, state):
+        """Return a cached solution for state, or None"""
+        key = self.key_for(state)
+        moves = self.memory.get(key)
+        if moves is not None:
+            self.memory.move_to_end(key)
+            return list(moves)
+        
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                moves = text_to_moves(f.read())
+            os.utime(path)  # Mark as recently used for eviction
+        except (OSError, ValueError):
+            return None
+        
+        if not self._solves(state, moves):
+            # Corrupt or stale entry, drop it
+            self._remove(path)
+            return None
+        self._remember(key, moves)
+        return list(moves)
+    
+    def put(self, state, moves):
+        """Store a solution unless a shorter one is already cached"""
+        existing = self.get(state)
+        if existing is not None and len(existing) <= len(moves):
+            return
+        key = self.key_for(state)
+        self._remember(key, list(moves))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(path, "w") as f:
+                f.write(moves_to_text(moves))
+            if self.disk_bytes is None:
+                self.disk_bytes = self._measure()
+            else:
+                self.disk_bytes += os.path.getsize(path) - old_size
+            if self.disk_bytes > self.max_disk_bytes:
+                self._evict()
+        except OSError as e:
+            print(f"Could not write solution cache: {e}")
+    
+    def _remember(self, key, moves):
+        self.memory[key] = moves
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+    
+    @staticmethod
+    def _solves(state, moves):
+        replay = CompactState.from_state(state)
+        for move in moves:
+            if move not in replay.get_possible_moves():
+                return False
+            replay = replay.apply_move(*move)
+        return replay.is_solved()
+    
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".sol"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+    
+    def _measure(self):
+        return sum(size for _, size, _ in self._entries())
+    
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            if self.disk_bytes is not None:
+                self.disk_bytes -= size
+        except OSError:
+            pass
+    
+    def _evict(self):
+        """Delete least recently used files until the store is back under three quarters of its budget"""
+        for _, size, path in sorted(self._entries()):
+            if self.disk_bytes <= self.max_disk_bytes * 3 // 4:
+                break
+            self._remove(path)
+
+class SolverWorker:
+    """Runs a solver on a background thread and hands progress and solutions to the game loop"""
+    def __init__(self, solver, deadline=None):
+        self.solver = solver
+        self.deadline = deadline  # time.monotonic() value at which the search gives up
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.progress = {}
+        self.best_solution = None
+        self.solution_version = 0  # Bumped on every improved solution
+        self.done = False
+        solver.attach(self._on_progress, self._on_solution, self.cancel_event)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    @property
+    def running(self):
+        return not self.done
+    
+    def _on_progress(self, progress):
+        with self.lock:
+            self.progress = dict(progress)
+    
+    def _on_solution(self, path):
+        shorter = optimize_solution(self.solver.initial_state, path)
+        if len(shorter) < len(path):
+            print(f"Post-optimizer shortened the solution from {len(path)} to {len(shorter)} moves "
+                  f"({len(path) - len(shorter)} saved)")
+            path = shorter
+        with self.lock:
+            if self.best_solution is None or len(path) < len(self.best_solution):
+                self.best_solution = path
+                self.solution_version += 1
+                self.progress['best_length'] = len(path)
+    
+    def _run(self):
+        try:
+            path = self.solver.solve(deadline=self.deadline)
+            if path:
+                self._on_solution(path)
+        except Exception as e:
+            print(f"Solver failed: {e}")
+        finally:
+            self.done = True
+    
+    def snapshot(self):
+        """Return (progress, best solution, solution version, done) for the render thread"""
+        with self.lock:
+            return dict(self.progress), self.best_solution, self.solution_version, self.done
+
+class MoveLog:
+    """Undo/redo history as one byte per move: direction index plus a pushed-crate flag.
+    
+    Moves past position have been undone and can be redone; making a new
+    move drops them. The applied moves read as a LURD string, lowercase for
+    walks and uppercase for pushes.
+    """
+    PUSHED = 4
+    
+    def __init__(self, data=b""):
+        self.data = bytearray(data)
+        self.position = len(self.data)
+    
+    def __len__(self):
+        return self.position
+    
+    def record(self, direction, pushed):
+        del self.data[self.position:]
+        self.data.append(direction | (self.PUSHED if pushed else 0))
+        self.position += 1
+    
+    def undo(self):
+        """Step back; returns (direction index, pushed) of the move to reverse, or None"""
+        if not self.position:
+            return None
+        self.position -= 1
+        entry = self.data[self.position]
+        return entry & 3, bool(entry & self.PUSHED)
+    
+    def redo(self):
+        """Step forward; returns (direction index, pushed) of the move to replay, or None"""
+        if self.position == len(self.data):
+            return None
+        entry = self.data[self.position]
+        self.position += 1
+        return entry & 3, bool(entry & self.PUSHED)
+    
+    def push_count(self):
+        return sum(1 for entry in self.data[:self.position] if entry & self.PUSHED)
+    
+    def to_text(self):
+        return ''.join(MOVE_LETTERS[entry & 3].upper() if entry & self.PUSHED else MOVE_LETTERS[entry & 3]
+                       for entry in self.data[:self.position])
+    
+    def moves(self):
+        """The applied moves as (dx, dy) pairs"""
+        return [DIRECTIONS[entry & 3] for entry in self.data[:self.position]]
+    
+    def pushes(self):
+        """Whether each applied move pushed a crate"""
+        return [bool(entry & self.PUSHED) for entry in self.data[:self.position]]
+    
+    @classmethod
+    def from_text(cls, text):
+        """Parse a LURD string; letter case sets the pushed flag.
         
-        for iteration in range(self.max_iterations):
-            # Check if we found a solution
-            if current_state.is_solved():
-                move_count = len(path)
-                print(f"Solution found in {iteration} iterations with {move_count} moves!")
-                
-                # Keep track of the best (shortest) solution found
-                if move_count < self.best_move_count:
-                    self.best_move_count = move_count
-                    self.best_solution = path[:]
-                    print(f"New best solution: {move_count} moves!")
-                
-                # Continue searching for better solutions unless we're at max iterations
-                if iteration < self.max_iterations * 0.8:  # Keep searching for 80% of iterations
-                    # Restart from beginning with different random seed
-                    current_state = self.initial_state.copy()
-                    current_cost = current_state.evaluate()
-                    path = []
-                    temperature = self.initial_temp * 0.8  # Slightly lower temperature
-                    continue
-                else:
-                    break
-            
-            # Prevent overly long solutions
-            if len(path) > self.max_moves:
-                # Restart with a fresh state
-                current_state = self.initial_state.copy()
-                current_cost = current_state.evaluate()
-                path = []
-                temperature = self.initial_temp * 0.5
+        Whitespace is skipped and a run length may come before a letter,
+        as in "3r" for "rrr". Raises ValueError naming the first character
+        that is neither.
+        """
+        log = cls()
+        count = ''
+        for position, letter in enumerate(text):
+            if letter.isspace():
                 continue
-            
-            # Get possible moves
-            possible_moves = current_state.get_possible_moves()
-            if not possible_moves:
-                # Dead end - restart
-                current_state = self.initial_state.copy()
-                current_cost = current_state.evaluate()
-                path = []
-                temperature = self.initial_temp * 0.7
+            if letter in '0123456789':
+                count += letter
                 continue
-            
-            # Choose a random move
-            move = random.choice(possible_moves)
-            new_state = current_state.apply_move(move[0], move[1])
-            new_cost = new_state.evaluate()
-            
-            # Calculate acceptance probability
-            if new_cost < current_cost:
-                # Better solution, accept it
-                current_state = new_state
-                current_cost = new_cost
-                path.append(move)
-                
-                if new_cost < best_cost:
-                    best_state = new_state.copy()
-                    best_cost = new_cost
-            else:
-                # Worse solution, accept with probability
-                if temperature > 0:
-                    probability = math.exp(-(new_cost - current_cost) / temperature)
-                    if random.random() < probability:
-                        current_state = new_state
-                        current_cost = new_cost
-                        path.append(move)
-            
-            # Cool down
-            temperature *= self.cooling_rate
-            
-            # Print progress occasionally
-            if iteration % 500 == 0:
-                best_so_far = f", Best: {self.best_move_count} moves" if self.best_solution else ""
-                print(f"Iteration {iteration}, Cost: {current_cost:.2f}, Moves: {len(path)}, Temp: {temperature:.2f}{best_so_far}")
-        
-        if self.best_solution:
-            print(f"Solver finished. Best solution: {self.best_move_count} moves")
-            return self.best_solution
-        else:
-            print(f"Solver finished. No solution found.")
-            return None
+            direction = MOVE_LETTERS.find(letter.lower())
+            if direction < 0:
+                raise ValueError(f"{letter!r} at position {position} is not one of the LURD move letters")
+            log.data.extend([direction | (cls.PUSHED if letter.isupper() else 0)] * int(count or 1))
+            count = ''
+        if count:
+            raise ValueError(f"Run length {count} at the end is not followed by a move")
+        log.position = len(log.data)
+        return log
 
 class BoxBangGame:
-    def __init__(self):
-        self.level_num = 1
+    def __init__(self, levels=None, solve_time=None):
+        self.levels = levels if levels is not None else open_levels(".")
+        if not len(self.levels):
+            print("No levels found, using the built-in level")
+            self.levels = LevelPack(DEFAULT_LEVEL.encode(), "default")
+        self.level_num = self.levels.numbers[0]
         self.auto_solve = False
         self.auto_solve_delay = 0  # seconds between auto moves
         self.last_auto_move_time = 0
         self.solver = None
+        self.solver_worker = None
+        self.solver_progress = {}
+        self.solution_version = 0
+        self.solution_cache = SolutionCache()
+        self.solver_engine = SOLVER_ENGINES[0]
+        self.solve_time = solve_time  # Seconds a background search may run, None for no limit
         self.solution_moves = []
         self.current_move_index = 0
         self.show_level_select = False
-        self.available_levels = self.scan_available_levels()
+        self._static_surface = None  # Floor, walls and targets of the current level, see draw()
+        self._drawn = None           # What is on screen now, so a frame can skip everything unchanged
+        self._text_cache = {}
+        self.stats_text = None  # Frame statistics line, set by main() while they are shown
+        self.hint_engine = HintEngine()
+        self.show_hints = False
+        self.hint = None        # Next push for the current position while hints are on, see update_hint()
+        self._hint_position = None
+        self.hint_worker = None  # SolverWorker replanning hints; while it runs only it touches hint_engine
+        self._hint_solutions = []  # Auto-solve solutions waiting for the hint worker to finish
+        self.available_levels = list(self.levels.numbers)
         self.load_level(self.level_num)
-        self.current_level = 0  # Track current level number
-        self.max_levels = len(self.scan_available_levels())  # Get total levels
-    
-    def scan_available_levels(self):
-        """Scan for available level files"""
-        levels = []
-        for i in range(1, 101):  # Check for levels 1-100
-            if os.path.exists(f"lvl{i}.txt"):
-                levels.append(i)
-        
-        # If no level files found, create a default level
-        if not levels:
-            self.create_default_level()
-            levels = [1]
-        
-        return levels
-    
     
     def load_level(self, level_num):
-        """Load a level from file"""
-        filename = f"lvl{level_num}.txt"
-        
-        if not os.path.exists(filename):
-            print(f"Level {level_num} not found!")
-            return False
-        
+        """Load a level, or restart it; each level is parsed only once"""
         try:
-            with open(filename, "r") as f:
-                level_data = f.read().strip().split('\n')
-            
-            self.grid = []
-            self.player_pos = [0, 0]
-            self.crates_pos = []
-            self.targets_pos = []
-            
-            for y, row in enumerate(level_data):
-                grid_row = []
-                for x, cell in enumerate(row):
-                    if cell == PLAYER:
-                        self.player_pos = [x, y]
-                        grid_row.append(FLOOR)
-                    elif cell == CRATE:
-                        self.crates_pos.append([x, y])
-                        grid_row.append(FLOOR)
-                    elif cell == TARGET:
-                        self.targets_pos.append([x, y])
-                        grid_row.append(FLOOR)
-                    elif cell == CRATE_ON_TARGET:
-                        self.crates_pos.append([x, y])
-                        self.targets_pos.append([x, y])
-                        grid_row.append(FLOOR)
-                    elif cell == PLAYER_ON_TARGET:
-                        self.player_pos = [x, y]
-                        self.targets_pos.append([x, y])
-                        grid_row.append(FLOOR)
-                    else:
-                        grid_row.append(cell)
-                self.grid.append(grid_row)
+            level = self.levels.get(level_num)
+            if level is None:
+                print(f"Level {level_num} not found!")
+                return False
+            
+            self.grid = level.grid
+            self.player_pos = level.player_pos[:]
+            self.crates_pos = [crate[:] for crate in level.crates_pos]
+            self.crate_index = {tuple(crate): i for i, crate in enumerate(self.crates_pos)}
+            self.targets_pos = level.targets_pos
             
             self.level_num = level_num
             self.move_count = 0
-            self.moves_history = []
-            self.game_state = GameState(self.grid, self.player_pos, self.crates_pos, self.targets_pos)
+            self.move_log = MoveLog()
+            
+            # Static solver tables (dead squares etc.) are built once per level
+            self.board = level.board
+            self._static_surface = None
+            self._drawn = None  # Also redraws the level select screen, which shows the current level
+            self.game_state = GameState(self.grid, self.player_pos, self.crates_pos, self.targets_pos, board=self.board)
             
             # Reset auto-solve state
+            self.cancel_solver()
             self.auto_solve = False
             self.solver = None
             self.solution_moves = []
             self.current_move_index = 0
+            self.hint = None
+            self._hint_position = None
+            self.cancel_hint_search()
             
             print(f"Loaded level {level_num}")
             return True
@@ -400,7 +3206,8 @@ class BoxBangGame:
             [row[:] for row in self.grid],
             self.player_pos[:],
             [crate[:] for crate in self.crates_pos],
-            self.targets_pos[:]
+            self.targets_pos[:],
+            board=self.board
         )
     
     def is_valid_move(self, dx, dy):
@@ -417,13 +3224,7 @@ class BoxBangGame:
             return False
         
         # Check if position has a crate
-        crate_idx = -1
-        for i, crate in enumerate(self.crates_pos):
-            if crate[0] == new_x and crate[1] == new_y:
-                crate_idx = i
-                break
-        
-        if crate_idx >= 0:
+        if (new_x, new_y) in self.crate_index:
             # There is a crate, so check if it can be pushed
             new_crate_x, new_crate_y = new_x + dx, new_y + dy
             
@@ -437,9 +3238,8 @@ class BoxBangGame:
                 return False
             
             # Check if new crate position has another crate
-            for crate in self.crates_pos:
-                if crate[0] == new_crate_x and crate[1] == new_crate_y:
-                    return False
+            if (new_crate_x, new_crate_y) in self.crate_index:
+                return False
         
         return True
     
@@ -448,82 +3248,208 @@ class BoxBangGame:
         if not self.is_valid_move(dx, dy):
             return False
         
-        new_x, new_y = self.player_pos[0] + dx, self.player_pos[1] + dy
-        
         # Save the move for undo functionality
-        old_state = {
-            'player_pos': self.player_pos[:],
-            'crates_pos': [crate[:] for crate in self.crates_pos],
-            'move_count': self.move_count
-        }
-        self.moves_history.append(old_state)
-        
-        # Check if there's a crate to push
-        crate_idx = -1
-        for i, crate in enumerate(self.crates_pos):
-            if crate[0] == new_x and crate[1] == new_y:
-                crate_idx = i
-                break
-        
-        if crate_idx >= 0:
-            # Push the crate
-            self.crates_pos[crate_idx][0] += dx
-            self.crates_pos[crate_idx][1] += dy
-        
-        # Move the player
-        self.player_pos[0] = new_x
-        self.player_pos[1] = new_y
-        self.move_count += 1
+        pushed = self._step(dx, dy)
+        self.move_log.record(DIRECTIONS.index((dx, dy)), pushed)
         
         # Check if level is completed
         if self.is_level_completed():
-            print(f"Level {self.level_num} completed in {self.move_count} moves!")
+            print(f"Level {self.level_num} completed in {self.move_count} moves: {self.move_log.to_text()}")
             # Don't auto-advance to next level anymore
             # self.level_num += 1
             # self.load_level(self.level_num)
         
         return True
     
+    def _step(self, dx, dy):
+        """Move the player by one (already validated) step; returns whether a crate was pushed"""
+        new_x, new_y = self.player_pos[0] + dx, self.player_pos[1] + dy
+        crate_idx = self.crate_index.pop((new_x, new_y), None)
+        if crate_idx is not None:
+            # Push the crate
+            crate = self.crates_pos[crate_idx]
+            crate[0] += dx
+            crate[1] += dy
+            self.crate_index[(crate[0], crate[1])] = crate_idx
+        
+        # Move the player
+        self.player_pos[0] = new_x
+        self.player_pos[1] = new_y
+        self.move_count += 1
+        return crate_idx is not None
+    
     def undo_move(self):
-        """Undo the last move"""
-        if not self.moves_history:
+        """Undo the last move by reversing its delta"""
+        entry = self.move_log.undo()
+        if entry is None:
             return False
         
-        last_state = self.moves_history.pop()
-        self.player_pos = last_state['player_pos']
-        self.crates_pos = last_state['crates_pos']
-        self.move_count = last_state['move_count']
-        
+        direction, pushed = entry
+        dx, dy = DIRECTIONS[direction]
+        x, y = self.player_pos
+        if pushed:
+            # The crate sits one step ahead of the player and goes back to where the player stands
+            crate_idx = self.crate_index.pop((x + dx, y + dy))
+            self.crates_pos[crate_idx][0] = x
+            self.crates_pos[crate_idx][1] = y
+            self.crate_index[(x, y)] = crate_idx
+        self.player_pos[0] = x - dx
+        self.player_pos[1] = y - dy
+        self.move_count -= 1
         return True
     
-    def is_level_completed(self):
-        """Check if all crates are on targets"""
-        for crate in self.crates_pos:
-            if crate not in self.targets_pos:
-                return False
+    def redo_move(self):
+        """Replay the last undone move"""
+        entry = self.move_log.redo()
+        if entry is None:
+            return False
+        self._step(*DIRECTIONS[entry[0]])
         return True
     
+    def is_level_completed(self):
+        """Check if all crates are on targets (or all targets covered when there are spare crates)"""
+        crates_on_targets = sum(1 for crate in self.crates_pos if crate in self.targets_pos)
+        return crates_on_targets == min(len(self.crates_pos), len(self.targets_pos))
+    
     def toggle_auto_solve(self):
         """Toggle automatic solving on/off"""
-        if not self.auto_solve:
-            # Start auto-solving
-            print("Starting auto-solve with simulated annealing (optimized for shortest path)...")
+        if not self.auto_solve and not self.is_solving():
             current_state = self.get_current_state()
-            self.solver = SimulatedAnnealingSolver(current_state)
-            self.solution_moves = self.solver.solve()
+            self.solve_origin = self._position_key()
+            self.solve_origin_state = current_state
             
-            if self.solution_moves:
-                self.auto_solve = True
+            # A position solved before plays back straight away
+            cached = self.solution_cache.get(current_state)
+            if cached is not None:
+                print(f"Using cached solution with {len(cached)} moves")
+                self.solution_moves = []
                 self.current_move_index = 0
-                print(f"Optimal solution found with {len(self.solution_moves)} moves!")
-                print("Starting animation...")
-            else:
-                print("No solution found!")
+                self._adopt_solution(cached)
+                return
+            
+            # Start auto-solving in the background, the game loop picks up results in update_solver()
+            print(f"Starting auto-solve with the {self.solver_engine} engine...")
+            self.solver = create_solver(self.solver_engine, current_state)
+            deadline = time.monotonic() + self.solve_time if self.solve_time else None
+            self.solver_worker = SolverWorker(self.solver, deadline)
+            self.solver_progress = {}
+            self.solution_version = 0
+            self.solution_moves = []
+            self.current_move_index = 0
+            self.solver_worker.start()
         else:
-            # Stop auto-solving
+            # Stop auto-solving and any search still running
+            self.cancel_solver()
             self.auto_solve = False
             print("Auto-solving stopped")
     
+    def is_solving(self):
+        return self.solver_worker is not None and self.solver_worker.running
+    
+    def cancel_solver(self):
+        """Stop the background search, keeping whatever solution it already produced"""
+        if self.solver_worker is not None:
+            self.solver_worker.cancel()
+            self.solver_worker = None
+    
+    def _position_key(self):
+        return tuple(self.player_pos), tuple(sorted(map(tuple, self.crates_pos)))
+    
+    def update_solver(self):
+        """Pick up progress and improved solutions from the background solver"""
+        if self.solver_worker is None:
+            return
+        progress, solution, version, done = self.solver_worker.snapshot()
+        self.solver_progress = progress
+        
+        if solution is not None and version != self.solution_version:
+            self.solution_version = version
+            self.solution_cache.put(self.solve_origin_state, solution)
+            self._hint_solutions.append((self.solve_origin_state, solution))
+            self._adopt_solution(solution)
+        
+        if done:
+            self.solver_worker = None
+            if self.solution_moves:
+                print(f"Search finished, best solution: {len(self.solution_moves)} moves")
+            else:
+                print("No solution found!")
+    
+    def _adopt_solution(self, solution):
+        """Start playback of the first solution, or switch to a better one that agrees with the moves played so far"""
+        played = self.solution_moves[:self.current_move_index]
+        if self.current_move_index == 0:
+            if self._position_key() != self.solve_origin:
+                print("Position changed while solving, ignoring solution")
+                return
+        elif solution[:self.current_move_index] != played:
+            print(f"Better solution found ({len(solution)} moves), but playback has already diverged")
+            return
+        
+        first = not self.solution_moves
+        self.solution_moves = solution
+        if first:
+            self.auto_solve = True
+            self.last_auto_move_time = time.time()
+            print(f"Solution found with {len(solution)} moves! Starting animation...")
+        else:
+            print(f"Switched to a better solution: {len(solution)} moves")
+    
+    def toggle_hints(self):
+        """Show or hide the next push for the current position"""
+        self.show_hints = not self.show_hints
+        self.hint = None
+        self._hint_position = None
+        self.cancel_hint_search()
+        print(f"Hints: {'ON' if self.show_hints else 'OFF'}")
+    
+    def is_hinting(self):
+        return self.hint_worker is not None
+    
+    def cancel_hint_search(self):
+        """Stop a background replan; update_hint() drops its result once it has wound down"""
+        if self.hint_worker is not None:
+            self.hint_worker.cancel()
+    
+    def update_hint(self):
+        """Recompute the hint once per new position.
+        
+        Positions on a plan are looked up right here. Anything that needs a
+        search runs on a SolverWorker, and the last hint stays on screen
+        until it is done.
+        """
+        worker = self.hint_worker
+        position = self._position_key()
+        if worker is not None:
+            if worker.running:
+                if position != worker.solver.position or not self.show_hints:
+                    worker.cancel()
+                return
+            self.hint_worker = None
+            if worker.solver.position == position and self.show_hints and not worker.cancel_event.is_set():
+                self.hint = worker.solver.hint
+                self._hint_position = position
+        for state, solution in self._hint_solutions:
+            self.hint_engine.add_solution(state, solution)
+        self._hint_solutions.clear()
+        
+        if not self.show_hints or self.auto_solve or position == self._hint_position:
+            return
+        state = self.get_current_state()
+        if self.hint_engine.needs_search(state):
+            self.hint_worker = SolverWorker(HintSearch(self.hint_engine, state, position),
+                                            time.monotonic() + HINT_TIME)
+            self.hint_worker.start()
+            return
+        self.hint = self.hint_engine.hint(state)
+        self._hint_position = position
+    
+    def cycle_solver_engine(self):
+        """Switch to the next solver engine used by auto-solve"""
+        index = SOLVER_ENGINES.index(self.solver_engine)
+        self.solver_engine = SOLVER_ENGINES[(index + 1) % len(SOLVER_ENGINES)]
+        print(f"Solver engine: {self.solver_engine}")
+    
     def auto_solve_step(self):
         """Perform one step of automatic solving"""
         if not self.auto_solve or not self.solution_moves:
@@ -548,18 +3474,16 @@ class BoxBangGame:
     
     def next_level(self):
         """Load next level if available"""
-        if self.current_level < self.max_levels - 1:
-            self.current_level += 1
-            self.load_level(self.current_level)
-            return True
+        index = self.available_levels.index(self.level_num)
+        if index < len(self.available_levels) - 1:
+            return self.load_level(self.available_levels[index + 1])
         return False
 
     def previous_level(self):
         """Load previous level if available"""
-        if self.current_level > 0:
-            self.current_level -= 1
-            self.load_level(self.current_level)
-            return True
+        index = self.available_levels.index(self.level_num)
+        if index > 0:
+            return self.load_level(self.available_levels[index - 1])
         return False
     
     def toggle_level_select(self):
@@ -636,110 +3560,225 @@ class BoxBangGame:
                 screen.blit(text, (50, 450 + i * 20))
     
     def draw(self):
-        """Draw the game state to the screen"""
+        """Draw the game state to the screen, touching only what changed since the last frame"""
         if self.show_level_select:
-            self.draw_level_select()
+            if self._drawn != 'select':
+                self.draw_level_select()
+                pygame.display.flip()
+                self._drawn = 'select'
             return
         
-        # Clear the screen
-        screen.fill(BLACK)
-        
-        # Draw the grid
+        if self._static_surface is None:
+            self._static_surface = self._build_static_surface()
+            self._drawn = None
+        items = self._scene_items()
+        if self._drawn is None or self._drawn == 'select':
+            # First frame of a level: everything
+            screen.blit(self._static_surface, (0, 0))
+            for item in items:
+                self._draw_item(item)
+            pygame.display.flip()
+        elif items != self._drawn:
+            # Only the tiles and text that moved, appeared or disappeared
+            changed = set(items).symmetric_difference(self._drawn)
+            dirty = [pygame.Rect(item[0]) for item in changed]
+            # Each dirty rect is rebuilt in full, clipped so items overlapping it leave their other pixels alone
+            for rect in dirty:
+                screen.set_clip(rect)
+                screen.blit(self._static_surface, rect, rect)
+                for item in items:
+                    if rect.colliderect(item[0]):
+                        self._draw_item(item)
+            screen.set_clip(None)
+            pygame.display.update(dirty)
+        self._drawn = items
+    
+    def invalidate(self):
+        """Make the next draw() repaint the whole window"""
+        self._static_surface = None
+        self._drawn = None
+    
+    def _board_offset(self):
         board_width = len(self.grid[0]) * TILE_SIZE
         board_height = len(self.grid) * TILE_SIZE
-        board_offset_x = (SCREEN_WIDTH - board_width) // 2
-        board_offset_y = (SCREEN_HEIGHT - board_height) // 2
+        return (SCREEN_WIDTH - board_width) // 2, (SCREEN_HEIGHT - board_height) // 2
+    
+    def _build_static_surface(self):
+        """Pre-render everything that only changes with the level: floor, walls, targets and the help text"""
+        surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        surface.fill(BLACK)
+        board_offset_x, board_offset_y = self._board_offset()
         
         for y, row in enumerate(self.grid):
             for x, cell in enumerate(row):
                 pos_x = board_offset_x + x * TILE_SIZE
                 pos_y = board_offset_y + y * TILE_SIZE
-                
-                # Draw floor
-                pygame.draw.rect(screen, DARK_GRAY, (pos_x, pos_y, TILE_SIZE, TILE_SIZE))
-                
-                # Draw walls
-                if cell == WALL:
-                    pygame.draw.rect(screen, GRAY, (pos_x, pos_y, TILE_SIZE, TILE_SIZE))
+                color = GRAY if cell == WALL else DARK_GRAY
+                pygame.draw.rect(surface, color, (pos_x, pos_y, TILE_SIZE, TILE_SIZE))
         
-        # Draw targets
         for target in self.targets_pos:
             target_x = board_offset_x + target[0] * TILE_SIZE
             target_y = board_offset_y + target[1] * TILE_SIZE
-            pygame.draw.rect(screen, GREEN, (target_x, target_y, TILE_SIZE, TILE_SIZE))
+            pygame.draw.rect(surface, GREEN, (target_x, target_y, TILE_SIZE, TILE_SIZE))
+        
+        # Controls info
+        controls = [
+            "Arrow Keys: Move  |  S: Auto-solve  |  E: Solver Engine  |  H: Hints  |  R: Restart  |  Z/Y: Undo/Redo",
+            "L: Level Select  |  P/N: Prev/Next Level  |  1-9,0: Quick Level Select  |  F: Frame Stats"
+        ]
+        for i, control in enumerate(controls):
+            surface.blit(self._text(small_font, control, WHITE), (20, SCREEN_HEIGHT - 50 + i * 20))
+        return surface
+    
+    def _text(self, text_font, text, color):
+        """Rendered text, cached because font.render is one of the most expensive calls per frame"""
+        key = (text_font, text, color)
+        surface = self._text_cache.get(key)
+        if surface is None:
+            if len(self._text_cache) > 512:
+                self._text_cache.clear()  # Counters keep producing new strings
+            surface = self._text_cache[key] = text_font.render(text, True, color)
+        return surface
+    
+    def _scene_items(self):
+        """Everything drawn over the static layer, as hashable (rect, kind, detail) tuples"""
+        board_offset_x, board_offset_y = self._board_offset()
+        items = []
         
-        # Draw crates
         for crate in self.crates_pos:
-            crate_x = board_offset_x + crate[0] * TILE_SIZE
-            crate_y = board_offset_y + crate[1] * TILE_SIZE
-            
-            # Check if crate is on target
-            if crate in self.targets_pos:
-                pygame.draw.rect(screen, YELLOW, (crate_x, crate_y, TILE_SIZE, TILE_SIZE))
-            else:
-                pygame.draw.rect(screen, ORANGE, (crate_x, crate_y, TILE_SIZE, TILE_SIZE))
-            
-            # Draw crate inner detail
-            pygame.draw.rect(screen, DARK_GRAY, (crate_x + 5, crate_y + 5, TILE_SIZE - 10, TILE_SIZE - 10))
+            rect = (board_offset_x + crate[0] * TILE_SIZE, board_offset_y + crate[1] * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            items.append((rect, 'crate', crate in self.targets_pos))
+        
+        rect = (board_offset_x + self.player_pos[0] * TILE_SIZE, board_offset_y + self.player_pos[1] * TILE_SIZE,
+                TILE_SIZE, TILE_SIZE)
+        items.append((rect, 'player', None))
         
-        # Draw player
-        player_x = board_offset_x + self.player_pos[0] * TILE_SIZE
-        player_y = board_offset_y + self.player_pos[1] * TILE_SIZE
-        pygame.draw.circle(screen, BLUE, (player_x + TILE_SIZE // 2, player_y + TILE_SIZE // 2), TILE_SIZE // 2 - 5)
+        if self.hint is not None:
+            (x, y), direction = self.hint
+            rect = (board_offset_x + x * TILE_SIZE, board_offset_y + y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            items.append((rect, 'hint', direction))
+        
+        def text(text_font, string, color, position):
+            size = self._text(text_font, string, color).get_size()
+            items.append((position + size, 'text', (text_font, string, color)))
         
-        # Draw UI
         # Level info
-        level_text = font.render(f"Level: {self.level_num}", True, WHITE)
-        screen.blit(level_text, (20, 20))
+        text(font, f"Level: {self.level_num}", WHITE, (20, 20))
         
         # Move count
-        move_text = font.render(f"Moves: {self.move_count}", True, WHITE)
-        screen.blit(move_text, (20, 50))
+        text(font, f"Moves: {self.move_count}", WHITE, (20, 50))
         
         # Level completion status
         if self.is_level_completed():
-            completed_text = font.render("LEVEL COMPLETED!", True, GREEN)
-            screen.blit(completed_text, (20, 80))
+            text(font, "LEVEL COMPLETED!", GREEN, (20, 80))
         
         # Auto-solve status
+        if self.is_solving():
+            progress = self.solver_progress
+            text(small_font, f"Solving... it: {progress.get('iterations', 0)}  cost: {progress.get('best_cost', '-')}  "
+                             f"best: {progress.get('best_length') or '-'}  (S to cancel)", YELLOW, (20, 110))
+        
         if self.auto_solve:
-            auto_text = font.render("Auto-solving: ON", True, GREEN)
-            screen.blit(auto_text, (SCREEN_WIDTH - 180, 20))
-            
+            text(font, "Auto-solving: ON", GREEN, (SCREEN_WIDTH - 180, 20))
             if self.solution_moves:
-                progress_text = font.render(f"Progress: {self.current_move_index}/{len(self.solution_moves)}", True, WHITE)
-                screen.blit(progress_text, (SCREEN_WIDTH - 180, 50))
+                text(font, f"Progress: {self.current_move_index}/{len(self.solution_moves)}", WHITE,
+                     (SCREEN_WIDTH - 180, 50))
         else:
-            auto_text = font.render("Auto-solve: OFF", True, WHITE)
-            screen.blit(auto_text, (SCREEN_WIDTH - 180, 20))
+            text(font, "Auto-solve: OFF", WHITE, (SCREEN_WIDTH - 180, 20))
+        
+        text(small_font, f"Engine: {self.solver_engine}", WHITE, (SCREEN_WIDTH - 180, 80))
+        if self.show_hints and not self.auto_solve:
+            if self.hint is not None:
+                text(small_font, f"Hint: push {'up right down left'.split()[DIRECTIONS.index(self.hint[1])]}",
+                     PURPLE, (SCREEN_WIDTH - 180, 100))
+            elif self.is_hinting():
+                text(small_font, "Hint: searching...", PURPLE, (SCREEN_WIDTH - 180, 100))
+            elif not self.is_level_completed():
+                text(small_font, "Hint: none found", RED, (SCREEN_WIDTH - 180, 100))
         
         # Show solution info
         if self.solution_moves and not self.auto_solve:
-            solution_text = font.render(f"Solution: {len(self.solution_moves)} moves", True, YELLOW)
-            screen.blit(solution_text, (SCREEN_WIDTH - 180, 50))
-        
-        # Controls info
-        controls = [
-            "Arrow Keys: Move  |  S: Auto-solve  |  R: Restart  |  Z: Undo",
-            "L: Level Select  |  P/N: Prev/Next Level  |  1-9,0: Quick Level Select"
-        ]
+            text(font, f"Solution: {len(self.solution_moves)} moves", YELLOW, (SCREEN_WIDTH - 180, 50))
         
-        for i, control in enumerate(controls):
-            controls_text = small_font.render(control, True, WHITE)
-            screen.blit(controls_text, (20, SCREEN_HEIGHT - 50 + i * 20))
-        
-        # Update the display
-        pygame.display.flip()
+        if self.stats_text:
+            text(small_font, self.stats_text, GRAY, (20, SCREEN_HEIGHT - 75))
+        return items
+    
+    def _draw_item(self, item):
+        rect, kind, detail = item
+        x, y = rect[0], rect[1]
+        if kind == 'crate':
+            # Crates on targets are yellow
+            pygame.draw.rect(screen, YELLOW if detail else ORANGE, rect)
+            pygame.draw.rect(screen, DARK_GRAY, (x + 5, y + 5, TILE_SIZE - 10, TILE_SIZE - 10))
+        elif kind == 'player':
+            pygame.draw.circle(screen, BLUE, (x + TILE_SIZE // 2, y + TILE_SIZE // 2), TILE_SIZE // 2 - 5)
+        elif kind == 'hint':
+            # Outline the crate and point the way it should be pushed
+            pygame.draw.rect(screen, PURPLE, rect, 3)
+            dx, dy = detail
+            center_x, center_y = x + TILE_SIZE // 2, y + TILE_SIZE // 2
+            tip = (center_x + dx * (TILE_SIZE // 2 - 6), center_y + dy * (TILE_SIZE // 2 - 6))
+            pygame.draw.line(screen, PURPLE, (center_x, center_y), tip, 3)
+        else:
+            screen.blit(self._text(*detail), (x, y))
+
+class FrameStats:
+    """Frame time and process CPU use, summarised once a second for the HUD"""
+    def __init__(self, visible=False):
+        self.visible = visible
+        self.text = None
+        self._reset(time.perf_counter())
+    
+    def _reset(self, now):
+        self.window_start = now
+        self.cpu_start = time.process_time()
+        self.frames = 0
+        self.busy = 0.0
+        self.worst = 0.0
+    
+    def frame(self, seconds):
+        """Record one frame that took seconds of work; returns True when the summary changed"""
+        self.frames += 1
+        self.busy += seconds
+        self.worst = max(self.worst, seconds)
+        now = time.perf_counter()
+        elapsed = now - self.window_start
+        if elapsed < 1:
+            return False
+        # CPU covers the whole process, background solver threads included
+        cpu = (time.process_time() - self.cpu_start) / elapsed * 100
+        self.text = (f"{self.frames / elapsed:.0f} fps  frame {self.busy / self.frames * 1000:.2f} ms "
+                     f"(max {self.worst * 1000:.1f})  CPU {cpu:.0f}%")
+        self._reset(now)
+        return True
 
-def main():
-    game = BoxBangGame()
+def main(levels=None, fps=FPS, show_stats=False, solve_time=None):
+    init_display()
+    game = BoxBangGame(levels, solve_time)
+    stats = FrameStats(show_stats)
     running = True
     
     while running:
+        # Only auto-solve playback needs a steady frame rate; otherwise sleep
+        # until input arrives, waking now and then while a solver reports
+        # progress, a hint search runs or the frame statistics are on screen
+        if game.auto_solve:
+            clock.tick(fps)
+            events = pygame.event.get()
+        elif game.is_solving() or game.is_hinting() or stats.visible:
+            events = [pygame.event.wait(IDLE_POLL_MS)] + pygame.event.get()
+        else:
+            events = [pygame.event.wait()] + pygame.event.get()
+        frame_start = time.perf_counter()
+        
         # Handle events
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                # Uncovered or restored: the window lost pixels that no dirty rect knows about
+                game.invalidate()
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     if game.show_level_select:
@@ -758,8 +3797,17 @@ def main():
                     game.load_level(game.level_num)
                 elif event.key == pygame.K_s:
                     game.toggle_auto_solve()
+                elif event.key == pygame.K_e:
+                    game.cycle_solver_engine()
+                elif event.key == pygame.K_h:
+                    game.toggle_hints()
+                elif event.key == pygame.K_f:
+                    stats.visible = not stats.visible
+                    game.stats_text = stats.text if stats.visible else None
                 elif event.key == pygame.K_z:
                     game.undo_move()
+                elif event.key == pygame.K_y:
+                    game.redo_move()
                 elif event.key == pygame.K_l:
                     game.toggle_level_select()
                 elif event.key == pygame.K_PAGEUP:
@@ -776,17 +3824,624 @@ def main():
                     game.select_level_from_number(level)
 
         # Update game state
+        game.update_solver()
         if game.auto_solve:
             game.auto_solve_step()
+        game.update_hint()
 
         # Draw everything
         game.draw()
         
-        # Control game speed
-        clock.tick(FPS)
+        if stats.frame(time.perf_counter() - frame_start) and stats.visible:
+            game.stats_text = stats.text
 
     pygame.quit()
     sys.exit()
 
+def find_level_files(directory="."):
+    """Return the lvlN.txt files in directory, in level order"""
+    files = []
+    for path in glob.glob(os.path.join(directory, "lvl*.txt")):
+        match = re.fullmatch(r"lvl(\d+)\.txt", os.path.basename(path))
+        if match:
+            files.append((int(match.group(1)), path))
+    return [path for _, path in sorted(files)]
+
+PACK_EXTENSIONS = ('.xsb', '.sok')
+
+def expand_level_specs(paths):
+    """Replace every pack in paths by "pack#N" references to each of its levels"""
+    specs = []
+    for path in paths:
+        if path.lower().endswith(PACK_EXTENSIONS) and '#' not in path:
+            specs.extend(f"{path}#{number}" for number in LevelPack.shared(path).numbers)
+        else:
+            specs.append(path)
+    return specs
+
+def solve_level_file(filename, engine, options=None, time_limit=None, metrics_log=None, profile_dir=None):
+    """Solve one level file headlessly and return a report entry; time_limit is in seconds.
+    
+    Solver events are appended to metrics_log as JSON lines, and with
+    profile_dir the solve runs under cProfile, saving one .prof file per level.
+    """
+    # Solver chatter goes to stderr so stdout stays machine-readable
+    with contextlib.redirect_stdout(sys.stderr):
+        state = load_level_file(filename)
+        solver = create_solver(engine, state, **(options or {}))
+        writer = JsonLinesWriter(metrics_log, level=filename, engine=engine) if metrics_log else None
+        solver.observe(writer)
+        start = time.perf_counter()
+        deadline = time.monotonic() + time_limit if time_limit else None
+        try:
+            if profile_dir:
+                os.makedirs(profile_dir, exist_ok=True)
+                name = re.sub(r'[^\w.-]', '_', os.path.basename(filename))
+                path = profile_solver(solver, os.path.join(profile_dir, f"{name}.{engine}.prof"), deadline=deadline)
+            else:
+                path = solver.solve(deadline=deadline)
+        finally:
+            if writer is not None:
+                writer.close()
+        elapsed = time.perf_counter() - start
+        timed_out = deadline is not None and time.monotonic() >= deadline
+    
+    replay = None
+    saved = None
+    if path:
+        shorter = optimize_solution(state, path)
+        saved = len(path) - len(shorter)
+        path = shorter
+        replay = verify_solution(state, path, lurd=True)
+    return {
+        'level': filename,
+        'engine': engine,
+        'success': bool(path),
+        'time': round(elapsed, 4),
+        'iterations': solver.iterations,
+        'solution_length': len(path) if path else None,
+        'pushes': replay and replay['pushes'],
+        'moves_saved': saved,
+        'timed_out': timed_out,
+        'metrics': solver.metrics.snapshot(),
+        'solution': replay and replay['lurd'],
+    }
+
+def batch_solve(files, engine, jobs=1, options=None, time_limit=None, metrics_log=None, profile_dir=None):
+    """Solve several level files, optionally in a process pool, keeping the input order"""
+    if jobs <= 1:
+        return [solve_level_file(filename, engine, options, time_limit, metrics_log, profile_dir)
+                for filename in files]
+    count = len(files)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(solve_level_file, files, [engine] * count, [options] * count, [time_limit] * count,
+                                 [metrics_log] * count, [profile_dir] * count))
+
+# Binary solution archives start with this line, followed by one record per solution: a '<HI' header with
+# the byte length of the level spec and the move count, the spec in UTF-8, then the pack_moves() bytes
+SOLUTION_ARCHIVE_MAGIC = b"BoxBang solutions 1\n"
+SOLUTION_RECORD = struct.Struct('<HI')
+
+def write_solution_archive(path, entries):
+    """Write (level spec, moves) pairs, moves as (dx, dy) lists or LURD strings.
+    
+    A path ending in .bsol gets the packed binary format, anything else a
+    text file with one "spec<TAB>LURD" line per solution.
+    """
+    if path.endswith('.bsol'):
+        with open(path, "wb") as f:
+            f.write(SOLUTION_ARCHIVE_MAGIC)
+            for spec, moves in entries:
+                if isinstance(moves, str):
+                    moves = text_to_moves(moves)
+                name = spec.encode()
+                f.write(SOLUTION_RECORD.pack(len(name), len(moves)) + name + pack_moves(moves))
+    else:
+        with open(path, "w") as f:
+            for spec, moves in entries:
+                f.write(f"{spec}\t{moves if isinstance(moves, str) else moves_to_text(moves)}\n")
+
+def read_solution_archive(path):
+    """Return the (level spec, moves, pushed flags) of every solution in a text or binary archive.
+    
+    The pushed flags come from the letter case of a text archive's LURD
+    strings; they are None for binary archives and all-lowercase strings,
+    which only record the moves.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    entries = []
+    if data.startswith(SOLUTION_ARCHIVE_MAGIC):
+        offset = len(SOLUTION_ARCHIVE_MAGIC)
+        while offset < len(data):
+            name_length, count = SOLUTION_RECORD.unpack_from(data, offset)
+            offset += SOLUTION_RECORD.size
+            spec = data[offset:offset + name_length].decode()
+            offset += name_length
+            packed = (count + 3) // 4
+            entries.append((spec, unpack_moves(data[offset:offset + packed], count), None))
+            offset += packed
+        return entries
+    for number, line in enumerate(data.decode().splitlines(), 1):
+        if not line.strip() or line.startswith(';'):
+            continue
+        spec, tab, text = line.partition('\t')
+        if not tab:
+            raise ValueError(f"{path}:{number}: expected a level and a LURD string separated by a tab")
+        try:
+            log = MoveLog.from_text(text)
+        except ValueError as e:
+            raise ValueError(f"{path}:{number}: {e}") from None
+        entries.append((spec, log.moves(), log.pushes() if text != text.lower() else None))
+    return entries
+
+def verify_archive(path):
+    """Replay every solution of an archive against its level; specs are relative to the archive or cwd"""
+    levels = {}
+    reports = []
+    for spec, moves, pushes in read_solution_archive(path):
+        level = levels.get(spec)
+        if level is None:
+            relative = os.path.join(os.path.dirname(path), spec)
+            try:
+                level = levels[spec] = open_level(spec if os.path.exists(spec.partition('#')[0]) else relative)
+            except (OSError, ValueError) as e:
+                reports.append({'level': spec, 'valid': False, 'error': None, 'reason': f"cannot load the level: {e}"})
+                continue
+        reports.append({'level': spec, **verify_solution(level, moves, pushes=pushes)})
+    return reports
+
+# Grades by push-level A* nodes needed for a push-optimal solution: (most nodes, name)
+LEVEL_GRADES = ((10, 'trivial'), (100, 'easy'), (1000, 'medium'), (10000, 'hard'))
+
+def _random_room(rng, width, height, wall_density):
+    """Walled width x height grid with random inner walls; only the largest connected floor area is kept"""
+    grid = [[WALL if x in (0, width - 1) or y in (0, height - 1) or rng.random() < wall_density else FLOOR
+             for x in range(width)] for y in range(height)]
+    largest = []
+    seen = set()
+    for y in range(height):
+        for x in range(width):
+            if grid[y][x] != FLOOR or (x, y) in seen:
+                continue
+            area = [(x, y)]
+            seen.add((x, y))
+            for cx, cy in area:
+                for dx, dy in DIRECTIONS:
+                    step = (cx + dx, cy + dy)
+                    if grid[step[1]][step[0]] == FLOOR and step not in seen:
+                        seen.add(step)
+                        area.append(step)
+            if len(area) > len(largest):
+                largest = area
+    keep = set(largest)
+    for y in range(height):
+        for x in range(width):
+            if (x, y) not in keep:
+                grid[y][x] = WALL
+    return grid, largest
+
+def _pull_level(rng, width, height, crates, pulls, wall_density):
+    """One random room with crates pulled off their targets, or None if the room is too small"""
+    grid, floor = _random_room(rng, width, height, wall_density)
+    if len(floor) < crates + 2:
+        return None
+    targets = rng.sample(floor, crates)
+    player = rng.choice([cell for cell in floor if cell not in targets])
+    # A private board, so thousands of generated rooms do not fill LevelBoard's cache
+    board = LevelBoard(grid, targets, crates)
+    state = CompactState(board, board.index(*player), board.target_mask)
+    undo = None
+    for _ in range(pulls):
+        choices = [(cell, direction, child) for cell, direction, child in state.pull_successors()
+                   if (cell, direction) != undo]
+        if not choices:
+            break
+        cell, direction, state = rng.choice(choices)
+        undo = (cell + board.offsets[direction], (direction + 2) % 4)  # Pulling the crate straight back
+    return Level(grid, list(board.position(state.player)), state.crates_pos, [list(cell) for cell in targets])
+
+def generate_level(width, height, crates, pulls, seed=None, wall_density=0.15, attempts=50):
+    """Random level made by pulling crates away from a solved position, so it is solvable by construction.
+    
+    Rooms where a pull sequence leaves crates on their targets are retried;
+    the level moving the most crates off their targets wins.
+    """
+    rng = random.Random(seed)
+    best, best_moved = None, 0
+    for _ in range(attempts):
+        level = _pull_level(rng, width, height, crates, pulls, wall_density)
+        if level is None:
+            continue
+        moved = sum(1 for crate in level.crates_pos if crate not in level.targets_pos)
+        if moved > best_moved:
+            best, best_moved = level, moved
+            if moved == crates:
+                break
+    if best is None:
+        raise ValueError(f"Could not generate a {width}x{height} level with {crates} crates")
+    best.title = f"Generated {width}x{height}, {crates} crates, {pulls} pulls, seed {seed}"
+    return best
+
+def grade_level(level, max_nodes=20000):
+    """Difficulty from the push-optimal solver's effort; 'extreme' if it gives up within max_nodes"""
+    solver = PushSearchSolver(level.to_game_state(), max_nodes=max_nodes)
+    with contextlib.redirect_stdout(io.StringIO()):
+        path = solver.solve()
+    if path is None:
+        grade = 'extreme'
+    else:
+        grade = next((name for limit, name in LEVEL_GRADES if solver.nodes_expanded <= limit), 'expert')
+    return {
+        'grade': grade,
+        'nodes': solver.nodes_expanded,
+        'pushes': solver.best_push_count if path is not None else None,
+        'moves': len(path) if path is not None else None,
+    }
+
+def _generate_graded(width, height, crates, pulls, seed, wall_density, max_nodes):
+    level = generate_level(width, height, crates, pulls, seed, wall_density)
+    return {
+        'seed': seed,
+        'title': level.title,
+        'text': format_level(level.grid, level.player_pos, level.crates_pos, level.targets_pos),
+        **grade_level(level, max_nodes),
+    }
+
+def generate_levels(count, width, height, crates, pulls, seed=0, jobs=1, wall_density=0.15, max_nodes=20000):
+    """Generate and grade count levels with seeds seed, seed + 1, ..., optionally in a process pool"""
+    arguments = [[width] * count, [height] * count, [crates] * count, [pulls] * count,
+                 range(seed, seed + count), [wall_density] * count, [max_nodes] * count]
+    if jobs <= 1:
+        return list(map(_generate_graded, *arguments))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_generate_graded, *arguments))
+
+def write_levels(levels, output):
+    """Write generated levels to a .xsb/.sok pack, or as new lvlN.txt files in a directory; returns their specs"""
+    if output.lower().endswith(PACK_EXTENSIONS):
+        with open(output, "w") as f:
+            for level in levels:
+                f.write(f"{level['text']}\nTitle: {level['title']}\n"
+                        f"; Grade: {level['grade']} ({level['pushes']} pushes, {level['nodes']} nodes)\n\n")
+        return [f"{output}#{number}" for number in range(1, len(levels) + 1)]
+    
+    os.makedirs(output, exist_ok=True)
+    first = max(LevelFiles(output).numbers, default=0) + 1  # Never overwrite existing levels
+    specs = []
+    for number, level in enumerate(levels, first):
+        path = os.path.join(output, f"lvl{number}.txt")
+        with open(path, "w") as f:
+            f.write(level['text'] + "\n")
+        specs.append(path)
+    return specs
+
+BENCHMARK_FORMAT = 1
+
+# name -> (engine, options); engines listed in SEEDED_ENGINES also get the trial's seed
+BENCHMARK_CONFIGS = {
+    'astar-moves': ('astar-moves', {'max_nodes': 20000}),
+    'astar-pushes': ('astar-pushes', {'max_nodes': 20000}),
+    'push-astar': ('push-astar', {'max_nodes': 20000}),
+    'push-macro': ('push-macro', {'max_nodes': 20000}),
+    'push-bidir': ('push-bidir', {'max_nodes': 20000}),
+    'anneal': ('anneal', {'max_iterations': 5000}),
+    'anneal-portfolio': ('anneal-portfolio', {'max_iterations': 5000, 'workers': 2, 'chains': 4}),
+    'batch-bfs': ('batch-bfs', {'max_states': 2000000}),
+    'batch-beam': ('batch-beam', {}),
+}
+SEEDED_ENGINES = ('anneal', 'anneal-portfolio')
+
+def _peak_memory_kb():
+    """Peak resident set size of this process, or None where the platform does not report it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes
+
+def run_benchmark_trial(filename, config, seed, time_limit=None):
+    """Run one configuration on one level and measure it; meant to run in a fresh process"""
+    engine, options = BENCHMARK_CONFIGS[config]
+    options = dict(options)
+    if engine in SEEDED_ENGINES:
+        options['seed'] = seed
+    
+    with contextlib.redirect_stdout(sys.stderr):
+        state = load_level_file(filename)
+        solver = create_solver(engine, state, **options)
+        found = []  # (seconds since start, length) for every improvement
+        start = time.perf_counter()
+        solver.attach(on_solution=lambda path: found.append((time.perf_counter() - start, len(path))))
+        deadline = time.monotonic() + time_limit if time_limit else None
+        path = solver.solve(deadline=deadline)
+        elapsed = time.perf_counter() - start
+        timed_out = deadline is not None and time.monotonic() >= deadline
+    
+    if path and not found:
+        found.append((elapsed, len(path)))
+    return {
+        'seed': seed,
+        'success': bool(path),
+        'time': round(elapsed, 4),
+        'time_to_first': round(found[0][0], 4) if path else None,
+        'time_to_best': round(found[-1][0], 4) if path else None,
+        'iterations': solver.iterations,
+        'iterations_per_second': round(solver.iterations / elapsed, 1) if elapsed > 0 else None,
+        'peak_memory_kb': _peak_memory_kb(),
+        'solution_length': len(path) if path else None,
+        'timed_out': timed_out,
+    }
+
+def _median(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return round((values[middle - 1] + values[middle]) / 2, 4)
+
+def summarize_trials(trials):
+    """Collapse repeated trials of one configuration on one level into medians and rates"""
+    lengths = [trial['solution_length'] for trial in trials if trial['success']]
+    memory = [trial['peak_memory_kb'] for trial in trials if trial['peak_memory_kb'] is not None]
+    return {
+        'trials': len(trials),
+        'success_rate': round(sum(trial['success'] for trial in trials) / len(trials), 4),
+        'time': _median(trial['time'] for trial in trials),
+        'time_to_first': _median(trial['time_to_first'] for trial in trials),
+        'time_to_best': _median(trial['time_to_best'] for trial in trials),
+        'iterations_per_second': _median(trial['iterations_per_second'] for trial in trials),
+        'peak_memory_kb': max(memory) if memory else None,
+        'best_solution_length': min(lengths) if lengths else None,
+        'solution_length': _median(lengths),
+    }
+
+def run_benchmark(files, configs, trials=3, seed=0, jobs=1, time_limit=None):
+    """Run every configuration on every level file, each trial in its own process"""
+    tasks = [(config, filename, seed + trial)
+             for config in configs for filename in files for trial in range(trials)]
+    # One process per trial keeps peak memory figures from leaking between runs;
+    # spawn keeps a running game or solver out of the children. multiprocessing.Pool
+    # rather than ProcessPoolExecutor, whose max_tasks_per_child needs Python 3.11
+    with multiprocessing.get_context("spawn").Pool(jobs, maxtasksperchild=1) as pool:
+        outcomes = pool.starmap(run_benchmark_trial, [(filename, config, trial_seed, time_limit)
+                                                      for config, filename, trial_seed in tasks], chunksize=1)
+    
+    results = {}
+    for (config, filename, _), outcome in zip(tasks, outcomes):
+        entry = results.setdefault(config, {}).setdefault(os.path.basename(filename), [])
+        entry.append(outcome)
+    return {
+        'format': BENCHMARK_FORMAT,
+        'python': sys.version.split()[0],
+        'trials': trials,
+        'seed': seed,
+        'time_limit': time_limit,
+        'configs': {config: {'engine': BENCHMARK_CONFIGS[config][0], 'options': BENCHMARK_CONFIGS[config][1]}
+                    for config in configs},
+        'results': {config: {level: {'summary': summarize_trials(runs), 'runs': runs}
+                             for level, runs in levels.items()}
+                    for config, levels in results.items()},
+    }
+
+def compare_benchmarks(baseline, current, tolerance=0.25, min_seconds=0.05):
+    """List regressions of current against baseline, both as produced by run_benchmark()"""
+    regressions = []
+    for config, levels in current['results'].items():
+        for level, result in levels.items():
+            old = baseline.get('results', {}).get(config, {}).get(level)
+            if old is None:
+                continue
+            old, new = old['summary'], result['summary']
+            where = f"{config} {level}"
+            if new['success_rate'] < old['success_rate']:
+                regressions.append(f"{where}: success rate {old['success_rate']} -> {new['success_rate']}")
+            if (old['best_solution_length'] is not None and new['best_solution_length'] is not None
+                    and new['best_solution_length'] > old['best_solution_length']):
+                regressions.append(f"{where}: best solution {old['best_solution_length']} -> "
+                                   f"{new['best_solution_length']} moves")
+            # Times below min_seconds are mostly noise
+            for field in ('time', 'time_to_first'):
+                if (old[field] is not None and new[field] is not None
+                        and new[field] > max(old[field] * (1 + tolerance), min_seconds)):
+                    regressions.append(f"{where}: {field} {old[field]}s -> {new[field]}s")
+            if (old['peak_memory_kb'] is not None and new['peak_memory_kb'] is not None
+                    and new['peak_memory_kb'] > old['peak_memory_kb'] * (1 + tolerance)):
+                regressions.append(f"{where}: peak memory {old['peak_memory_kb']} -> {new['peak_memory_kb']} KB")
+    return regressions
+
+def _write_json(data, output=None):
+    text = json.dumps(data, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+def cli(argv):
+    """Command-line entry point; with no sub-command the game window opens"""
+    parser = argparse.ArgumentParser(prog="boxbang", description="BoxBang puzzle game and solvers")
+    commands = parser.add_subparsers(dest="command")
+    play = commands.add_parser("play", help="open the game window (default)")
+    play.add_argument("source", nargs="?", default=".", help="directory of lvlN.txt files or a .xsb/.sok pack")
+    play.add_argument("--fps", type=int, default=FPS, help="frame cap while auto-solve plays back (0: no cap)")
+    play.add_argument("--stats", action="store_true", help="show frame time and CPU use")
+    play.add_argument("--solve-time", type=float, help="seconds auto-solve may search before playing its best solution")
+    
+    batch = commands.add_parser("batch", help="solve levels without a display and print a JSON report")
+    batch.add_argument("levels", nargs="*", help="level files or packs (default: every lvlN.txt here)")
+    batch.add_argument("--engine", default="push-astar", choices=SOLVER_ENGINES)
+    batch.add_argument("--jobs", type=int, default=1, help="solve this many levels in parallel")
+    batch.add_argument("--max-nodes", type=int, help="node budget for the astar, idastar and push engines")
+    batch.add_argument("--max-iterations", type=int, help="iteration budget for the anneal engines")
+    batch.add_argument("--max-states", type=int, help="visited-state budget for the batch engines")
+    batch.add_argument("--time-limit", type=float, help="seconds each level may take; the best solution so far counts")
+    batch.add_argument("--table-mb", type=float, help="memory budget of the IDA* engines' transposition table")
+    batch.add_argument("--table-spill", metavar="DIR", help="spill entries the table has no room for to a file here")
+    batch.add_argument("--metrics", help="append solver progress, solution and finish events here as JSON lines")
+    batch.add_argument("--profile", metavar="DIR", help="run each solve under cProfile and save the profiles here")
+    batch.add_argument("--output", help="write the report here instead of stdout")
+    batch.add_argument("--solutions", metavar="FILE",
+                       help="save the solutions found as a LURD archive (.bsol: packed binary)")
+    batch.add_argument("--fail-on-unsolved", action="store_true", help="exit with status 1 if any level fails")
+    
+    bench = commands.add_parser("bench", help="benchmark solver configurations and write JSON results")
+    bench.add_argument("levels", nargs="*", help="level files or packs (default: every lvlN.txt here)")
+    bench.add_argument("--config", action="append", choices=list(BENCHMARK_CONFIGS),
+                       help="configuration to run, may be repeated (default: all)")
+    bench.add_argument("--trials", type=int, default=3, help="runs per configuration and level")
+    bench.add_argument("--seed", type=int, default=0, help="seed of the first trial, later trials count up")
+    bench.add_argument("--jobs", type=int, default=1, help="run this many trials in parallel")
+    bench.add_argument("--time-limit", type=float, help="cancel each trial after this many seconds")
+    bench.add_argument("--output", help="write the results here instead of stdout")
+    bench.add_argument("--baseline", help="compare against earlier results and exit with status 1 on regressions")
+    bench.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown and memory growth")
+    
+    compare = commands.add_parser("compare", help="compare two benchmark result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown and memory growth")
+    
+    generate = commands.add_parser("generate", help="generate solvable levels and grade them with the solver")
+    generate.add_argument("--count", type=int, default=10, help="number of levels")
+    generate.add_argument("--width", type=int, default=10, help="board width including the outer wall")
+    generate.add_argument("--height", type=int, default=8, help="board height including the outer wall")
+    generate.add_argument("--crates", type=int, default=3)
+    generate.add_argument("--pulls", type=int, default=50, help="random pulls away from the solved position")
+    generate.add_argument("--wall-density", type=float, default=0.15, help="chance of an inner wall per cell")
+    generate.add_argument("--seed", type=int, default=0, help="seed of the first level, later levels count up")
+    generate.add_argument("--jobs", type=int, default=1, help="generate this many levels in parallel")
+    generate.add_argument("--max-nodes", type=int, default=20000, help="solver budget for grading a level")
+    generate.add_argument("--output", default="generated.xsb", help="pack file, or a directory for lvlN.txt files")
+    
+    verify = commands.add_parser("verify", help="replay solution archives against their levels without a display")
+    verify.add_argument("archives", nargs="+", help="LURD text or .bsol archives, e.g. from batch --solutions")
+    verify.add_argument("--output", help="write the report here instead of stdout")
+    verify.add_argument("--fail-on-invalid", action="store_true", help="exit with status 1 if any solution fails")
+    
+    build = commands.add_parser("build-patterns", help="regenerate the deadlock pattern database")
+    build.add_argument("--output", default=PATTERN_FILE, help=f"pattern file to write (default: {PATTERN_FILE})")
+    
+    args = parser.parse_args(argv)
+    if args.command in (None, "play"):
+        main(open_levels(getattr(args, "source", ".")), getattr(args, "fps", FPS), getattr(args, "stats", False),
+             getattr(args, "solve_time", None))
+        return 0
+    
+    if args.command == "batch":
+        files = expand_level_specs(args.levels) if args.levels else find_level_files()
+        options = {}
+        # Each budget only exists for some engines; anything else would fail in the solver's constructor
+        for flag, option, prefixes in (("--max-nodes", 'max_nodes', ('astar', 'idastar', 'push-')),
+                                       ("--max-iterations", 'max_iterations', ('anneal',)),
+                                       ("--max-states", 'max_states', ('batch-',))):
+            value = getattr(args, option)
+            if value is None:
+                continue
+            if not args.engine.startswith(prefixes):
+                parser.error(f"{flag} only applies to the {', '.join(prefix + '*' for prefix in prefixes)} engines")
+            options[option] = value
+        if args.table_mb or args.table_spill:
+            if not args.engine.startswith('idastar'):
+                parser.error("--table-mb and --table-spill only apply to the idastar engines")
+            options['table_bytes'] = int((args.table_mb or 64) * 1024 * 1024)
+            options['table_spill'] = args.table_spill
+        start = time.perf_counter()
+        results = batch_solve(files, args.engine, args.jobs, options, args.time_limit, args.metrics, args.profile)
+        report = {
+            'engine': args.engine,
+            'jobs': args.jobs,
+            'time_limit': args.time_limit,
+            'total_time': round(time.perf_counter() - start, 4),
+            'solved': sum(result['success'] for result in results),
+            'levels': results,
+        }
+        if args.solutions:
+            write_solution_archive(args.solutions, [(result['level'], result['solution'])
+                                                    for result in results if result['success']])
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 1 if args.fail_on_unsolved and report['solved'] < len(results) else 0
+    
+    if args.command == "generate":
+        if args.width < 4 or args.height < 4 or args.crates < 1:
+            parser.error("levels need a width and height of at least 4 and at least one crate")
+        start = time.perf_counter()
+        levels = generate_levels(args.count, args.width, args.height, args.crates, args.pulls, args.seed,
+                                 args.jobs, args.wall_density, args.max_nodes)
+        specs = write_levels(levels, args.output)
+        _write_json({
+            'output': args.output,
+            'total_time': round(time.perf_counter() - start, 4),
+            'levels': [{'level': spec, **{key: value for key, value in level.items() if key != 'text'}}
+                       for spec, level in zip(specs, levels)],
+        })
+        return 0
+    
+    if args.command == "verify":
+        start = time.perf_counter()
+        solutions = []
+        for archive in args.archives:
+            try:
+                solutions.extend({'archive': archive, **report} for report in verify_archive(archive))
+            except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+                print(f"Cannot read {archive}: {e}", file=sys.stderr)
+                return 2
+        elapsed = time.perf_counter() - start
+        valid = sum(report['valid'] for report in solutions)
+        _write_json({
+            'total_time': round(elapsed, 4),
+            'checked': len(solutions),
+            'valid': valid,
+            'invalid': len(solutions) - valid,
+            'per_second': round(len(solutions) / elapsed) if elapsed else None,
+            'solutions': solutions,
+        }, args.output)
+        return 1 if args.fail_on_invalid and valid < len(solutions) else 0
+    
+    if args.command == "build-patterns":
+        start = time.perf_counter()
+        patterns = DeadlockPatterns.generate()
+        patterns.save(args.output)
+        print(f"Wrote {len(patterns)} dead {patterns.size}x{patterns.size} patterns to {args.output} "
+              f"({time.perf_counter() - start:.1f}s)")
+        return 0
+    
+    if args.command in ("bench", "compare"):
+        if args.command == "bench":
+            files = expand_level_specs(args.levels) if args.levels else find_level_files()
+            configs = args.config or [config for config, (engine, _) in BENCHMARK_CONFIGS.items()
+                                      if engine in SOLVER_ENGINES]
+            current = run_benchmark(files, configs, args.trials, args.seed,
+                                    args.jobs, args.time_limit)
+            _write_json(current, args.output)
+            if not args.baseline:
+                return 0
+            baseline_file = args.baseline
+        else:
+            baseline_file = args.baseline
+            with open(args.current) as f:
+                current = json.load(f)
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline.get('format') != BENCHMARK_FORMAT:
+            print(f"{baseline_file} has benchmark format {baseline.get('format')}, expected {BENCHMARK_FORMAT}",
+                  file=sys.stderr)
+            return 2
+        regressions = compare_benchmarks(baseline, current, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if not regressions:
+            print("No regressions", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli(sys.argv[1:]))
\ No newline at end of file